@@ -55,6 +55,7 @@ setup \
     , entry_points     = dict
         ( console_scripts =
             [ 'yabasi=yabasi.bas:main'
+            , 'yabasi-batch=yabasi.batch:main'
             ]
         )
     , classifiers      = \
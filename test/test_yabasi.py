@@ -25,14 +25,23 @@
 
 import re
 import os
+import json
+import pickle
+import asyncio
 import sys
 import pytest
 import inspect
 import doctest
+import random
+import numpy as np
 import yabasi
+from io import StringIO
 from textwrap import dedent
-from yabasi.bas import Interpreter, options, Interpreter_Test
+from concurrent.futures import ThreadPoolExecutor
+from yabasi.bas import Interpreter, options, Interpreter_Test, format_float
+from yabasi.bas import Memory_Filesystem
 from yabasi.mbf import MBF_Float
+from yabasi import batch, api
 try:
     import asm
 except ImportError:
@@ -109,6 +118,347 @@ class Test_Base (_Test_Common):
         self.run_test ('True\nFalse\nTrue\n')
     # end def test_eof
 
+    def test_random_file (self):
+        """
+            10 OPEN "test/random.tmp" FOR OUTPUT AS #1 LEN=6
+            20 FIELD #1, 4 AS X$, 2 AS I$
+            30 FOR I%=1 TO 3
+            40 LSET X$=MKS$(I%/2): LSET I$=MKI$(I%)
+            50 PUT #1
+            60 NEXT I%
+            70 CLOSE #1
+            80 OPEN "test/random.tmp" AS #1 LEN=6
+            90 FIELD #1, 4 AS X$, 2 AS I$
+            100 LSET I$=MKI$(42)
+            110 PUT #1, 2
+            120 CLOSE #1
+            130 OPEN "test/random.tmp" FOR INPUT AS #1 LEN=6
+            140 FIELD #1, 4 AS X$, 2 AS I$
+            150 WHILE NOT EOF(1)
+            160 GET #1
+            170 PRINT CVS(X$);" ";CVI(I$)
+            180 WEND
+            190 CLOSE #1
+            200 KILL "test/random.tmp"
+        """
+        try:
+            self.run_test (' .5 1\n 1.5 42\n 1.5 3\n')
+        finally:
+            if os.path.exists ('test/random.tmp'):
+                os.unlink ('test/random.tmp')
+    # end def test_random_file
+
+    def test_field_vars (self):
+        """
+            10 OPEN "r.dat" AS #1 LEN=8
+            20 FIELD #1, 5 AS A$, 3 AS B$
+            30 LSET A$="abc": RSET B$="x": MID$(A$,2,2)="YZ": PUT #1, 1
+            40 PRINT A$; "|"; B$
+            50 B$="qrs": MID$(A$,4)="!": PUT #1, 2: CLOSE #1
+            60 OPEN "r.dat" FOR INPUT AS #1: LINE INPUT #1, L$: PRINT L$
+        """
+        opt = ['--filesystem=memory', '']
+        self.run_test ('aYZ  |  x\naYZ    xaYZ! qrs\n', opt = opt)
+    # end def test_field_vars
+
+    def test_buffered_output (self):
+        """
+            10 OPEN "test/seq.tmp" FOR OUTPUT AS #1
+            20 FOR I%=1 TO 5
+            30 PRINT #1, "LINE";I%
+            40 NEXT I%
+            50 CLOSE #1
+            60 OPEN "test/seq.tmp" FOR APPEND AS #1
+            70 PRINT #1, 4.5
+            80 CLOSE #1
+            90 OPEN "test/seq.tmp" FOR INPUT AS #1
+            100 WHILE NOT EOF(1)
+            110 LINE INPUT #1, A$
+            120 PRINT A$
+            130 WEND
+            140 CLOSE #1
+            150 KILL "test/seq.tmp"
+        """
+        ret = ''.join ('LINE%d\n' % i for i in range (1, 6)) + ' 4.5\n'
+        try:
+            self.run_test (ret, opt = ['--output-buffer-size=8', ''])
+        finally:
+            if os.path.exists ('test/seq.tmp'):
+                os.unlink ('test/seq.tmp')
+    # end def test_buffered_output
+
+    def test_eof_text (self):
+        """
+            10 OPEN "test/eof.tmp" FOR OUTPUT AS #1
+            20 PRINT #1, "A"
+            30 PRINT #1, "B"
+            40 CLOSE #1
+            50 OPEN "test/eof.tmp" FOR INPUT AS #1
+            60 IF EOF(1) THEN 100
+            70 IF EOF(1) THEN 100
+            80 LINE INPUT #1, A$: PRINT A$
+            90 GOTO 60
+            100 CLOSE #1
+            110 KILL "test/eof.tmp"
+        """
+        try:
+            self.run_test ('A\nB\n')
+        finally:
+            if os.path.exists ('test/eof.tmp'):
+                os.unlink ('test/eof.tmp')
+    # end def test_eof_text
+
+    def test_input_fields (self):
+        """
+            10 OPEN "fields.txt" FOR OUTPUT AS #1
+            20 PRINT #1, " 1.5, 2 3"
+            30 Q$ = CHR$(34): PRINT #1, "1D2,  "; Q$; "a, b"; Q$; " ,c d"
+            40 PRINT #1, "": PRINT #1, " x y, 7.5": PRINT #1, "2,z, 7"
+            50 PRINT #1, "": PRINT #1, "-4"
+            60 CLOSE #1
+            70 OPEN "fields.txt" FOR INPUT AS #1
+            80 INPUT #1, A, B: PRINT A; B
+            90 INPUT #1, C, D, A$, B$: PRINT C; D; A$; "|"; B$
+            94 INPUT #1, E$: INPUT #1, G$, H
+            95 DIM X$(2): INPUT #1, N, X$(N), F%
+            96 PRINT "["; E$; "]"; G$; H; X$(2); F%
+            100 IF EOF(1) THEN 130
+            110 INPUT #1, E: PRINT E
+            120 GOTO 100
+            130 CLOSE #1
+        """
+        opt = ['--filesystem=memory', '']
+        self.run_test \
+            (' 1.5 2\n 3 100a, b|c d\n[]x y 7.5z7\n-4\n', opt = opt)
+    # end def test_input_fields
+
+    def test_input_print_file (self):
+        """
+            10 OPEN "rw.txt" FOR OUTPUT AS #1
+            20 PRINT #1, "1,2": PRINT #1, "3": PRINT #1, "4": CLOSE #1
+            30 OPEN "rw.txt" AS #1: INPUT #1, A, B: PRINT #1, "9"
+            40 INPUT #1, C: PRINT A; B; C: CLOSE #1
+            50 OPEN "rw.txt" FOR INPUT AS #1
+            60 IF EOF(1) THEN 80
+            70 LINE INPUT #1, A$: PRINT A$: GOTO 60
+            80 CLOSE #1
+        """
+        opt = ['--filesystem=memory', '']
+        self.run_test (' 1 2 4\n1,2\n9\n4\n', opt = opt)
+    # end def test_input_print_file
+
+    def test_write (self):
+        """
+            10 A=1.5: B%=-3: WRITE A, B%, "x"
+            20 OPEN "w.txt" FOR OUTPUT AS #1: WRITE #1, -.25, "a,b": CLOSE #1
+            30 OPEN "w.txt" FOR INPUT AS #1: INPUT #1, C, D$: PRINT C; D$
+        """
+        opt = ['--filesystem=memory', '']
+        self.run_test ('1.5,-3,"x"\n-.25a,b\n', opt = opt)
+    # end def test_write
+
+    def test_memmap (self):
+        """
+            10 DIM A(50,2), B%(3)
+            20 FOR I=0 TO 50: A(I,1)=I: NEXT I
+            30 B%(2)=7: PRINT A(50,1); B%(2)
+        """
+        def hook (interpreter):
+            if 'A' in interpreter.dim:
+                assert isinstance (interpreter.dim ['A'], np.memmap)
+                assert not isinstance (interpreter.dim ['B%'], np.memmap)
+                self.checked = True
+        self.checked = False
+        opt = ['--memmap-threshold=1000', '']
+        self.run_test (' 507\n', hook = hook, opt = opt)
+        assert self.checked
+    # end def test_memmap
+
+    def test_string_array (self):
+        """
+            10 DIM A$(3): A$(2)="xy": A$(3)=A$(2)+A$(1)
+            20 PRINT LEN(A$(1)); A$(1)+A$(3)
+        """
+        self.run_test ('0xy\n')
+    # end def test_string_array
+
+    def test_print_using (self):
+        """
+            10 FOR I=1 TO 2
+            20 PRINT USING "##.# ###";I/2;I*10;I
+            30 NEXT I
+        """
+        self.run_test (' 0.5  10  1\n 1.0  20  2\n')
+    # end def test_print_using
+
+    def test_rerun (self):
+        """
+            10 PRINT A;B$
+            20 A = A + 1: B$ = B$ + "x"
+            30 DIM C(2): C(1) = C(1) + 1: PRINT C(1)
+            40 READ D: PRINT D
+            50 DATA 42
+        """
+        args = options ([''])
+        prg  = dedent (self.test_rerun.__doc__).split ('\n')
+        bas  = Interpreter (args, program = prg)
+        for b in (bas, bas, pickle.loads (pickle.dumps (bas))):
+            out = StringIO ()
+            b.reset (ofile = out)
+            b.run ()
+            assert out.getvalue () == ' 0\n 1\n 42\n'
+    # end def test_rerun
+
+    def test_restore_line (self, capsys):
+        """
+            10 DATA 1, 2
+            20 FOR I = 1 TO 2: RESTORE 50: READ A$, B: PRINT A$; B: NEXT I
+            30 RESTORE: READ C, D: RESTORE 40: READ E$: PRINT C; D; E$
+            40 REM
+            50 DATA "X", 3: DATA 4
+            60 ON ERROR GOTO 80
+            70 RESTORE 55: PRINT "not reached"
+            80 PRINT "E"
+        """
+        self.run_test ('X 3\nX 3\n 1 2X\nE\n')
+        assert 'Undefined line number 55' in capsys.readouterr ().err
+    # end def test_restore_line
+
+    def test_read_array (self):
+        """
+            10 DIM A(5), B%(3), C$(2)
+            20 FOR I = 0 TO 5: READ A(I): NEXT I: PRINT I; A(0); A(5)
+            30 FOR J = 1 TO 3: READ B%(J): NEXT J: PRINT J; B%(1); B%(3)
+            40 FOR K = 1 TO 2: READ C$(K): NEXT K: PRINT K; C$(1); C$(2)
+            50 DATA 1, 2, 3, 4, 5, 6.5, 2.7, -1.5, 7, "x", "y"
+        """
+        self.run_test ('6 1 6.5\n427\n3xy\n')
+        # Bounds with side effects (RND) are not evaluated twice
+        prg = [ '10 DIM A(9): N = 3\n'
+              , '20 FOR I = 1 TO N: READ A(I): NEXT I\n'
+              , '30 FOR I = 1 TO RND(1) * 9: READ A(I): NEXT I\n'
+              ]
+        bas = Interpreter (options (['']), program = prg)
+        cmds = [c [0].__name__ for c in bas.lines [(20, 0)][1]]
+        assert cmds == ['cmd_read_array']
+        cmds = [c [0].__name__ for c in bas.lines [(30, 0)][1]]
+        assert cmds == ['cmd_for', 'cmd_read', 'cmd_next']
+    # end def test_read_array
+
+    def test_memory_filesystem (self):
+        """
+            10 OPEN "test/through.tmp" FOR INPUT AS #1
+            20 LINE INPUT #1, A$: CLOSE #1
+            30 OPEN "test/scratch.tmp" FOR OUTPUT AS #1
+            40 PRINT #1, A$; "!": CLOSE #1
+            50 OPEN "test/scratch.tmp" FOR INPUT AS #1
+            60 LINE INPUT #1, B$: CLOSE #1
+            70 PRINT B$
+            80 KILL "test/through.tmp"
+        """
+        with open ('test/through.tmp', 'w') as f:
+            print ('HELLO', file = f)
+        try:
+            self.run_test ('HELLO!\n', opt = ['--filesystem=memory', ''])
+            assert os.path.exists ('test/through.tmp')
+            assert not os.path.exists ('test/scratch.tmp')
+        finally:
+            for fn in ('test/through.tmp', 'test/scratch.tmp'):
+                if os.path.exists (fn):
+                    os.unlink (fn)
+    # end def test_memory_filesystem
+
+    def test_run_async (self):
+        """
+            10 FOR I=1 TO 2: INPUT "A";A: PRINT A*I: NEXT I
+            20 INPUT "B,C";B,C
+            30 FOR I=1 TO 100: S=S+I: NEXT I
+            40 PRINT B+C+S
+        """
+        args = options ([''])
+        prg  = dedent (self.test_run_async.__doc__).split ('\n')
+        sync = Interpreter (args, program = prg)
+        out  = StringIO ()
+        sync.reset ('5\n6\n3\n4', out)
+        sync.run ()
+        expect = out.getvalue ()
+        assert expect.endswith (' 5057\n')
+
+        async def session ():
+            values = ['5', '6', '3', '4']
+            async def get_input (prompt):
+                await asyncio.sleep (0)
+                return values.pop (0)
+            bas = Interpreter (args, program = prg)
+            out = StringIO ()
+            bas.reset (ofile = out)
+            await bas.run_async (get_input, count = 10)
+            return out.getvalue ()
+
+        async def sessions ():
+            return await asyncio.gather (session (), session ())
+        assert asyncio.run (sessions ()) == [expect, expect]
+    # end def test_run_async
+
+    def test_checkpoint (self, tmp_path):
+        """
+            10 DIM A(10): OPEN "ck.txt" FOR OUTPUT AS #1
+            20 FOR I = 1 TO 10: A(I) = I * I: NEXT I
+            30 FOR J = 1 TO 3: GOSUB 100: NEXT J
+            40 PRINT S: PRINT #1, S: CLOSE #1
+            50 END
+            100 S = S + A(J): PRINT J;: RETURN
+        """
+        ck   = str (tmp_path / 'ck.pkl')
+        prg  = dedent (self.test_checkpoint.__doc__).split ('\n')
+        fs   = Memory_Filesystem ()
+        args = options (['--checkpoint', ck, '--checkpoint-line', '100', ''])
+        bas  = Interpreter (args, program = prg)
+        out  = StringIO ()
+        bas.reset (ofile = out, fs = fs)
+        bas.run ()
+        assert out.getvalue () == '123 14\n'
+        # The checkpoint was written on first reaching line 100
+        bas = Interpreter (options (['']), program = prg)
+        out = StringIO ()
+        bas.reset (ofile = out)
+        bas.restore (ck)
+        assert bas.stack.top.count == 1
+        assert bas.files ['#1'].fs.files == {'ck.txt': b''}
+        bas.run ()
+        assert out.getvalue () == '123 14\n'
+        assert bas.fs.files == fs.files == {'ck.txt': b' 14\n'}
+        other = Interpreter (options (['']), program = prg [:-2])
+        with pytest.raises (ValueError):
+            other.restore (ck)
+        # Checkpoints cannot call arbitrary functions
+        with open (ck, 'wb') as f:
+            pickle.dump (bas.source, f)
+            pickle.dump ({'a': os.getcwd}, f)
+        with pytest.raises (pickle.UnpicklingError):
+            bas.restore (ck)
+    # end def test_checkpoint
+
+    def test_checkpoint_output (self, tmp_path, monkeypatch):
+        """
+            10 OPEN "o.txt" FOR OUTPUT AS #1: PRINT #1, "a"
+            20 OPEN "n.txt" FOR INPUT AS #2: INPUT #2, N: CLOSE #2
+            30 FOR I = 1 TO N: PRINT #1, I: NEXT I: CLOSE #1
+        """
+        monkeypatch.chdir (tmp_path)
+        prg = dedent (self.test_checkpoint_output.__doc__).split ('\n')
+        (tmp_path / 'n.txt').write_text ('5\n')
+        args = options (['--checkpoint', 'ck.pkl', '--checkpoint-line', '20', ''])
+        Interpreter (args, program = prg).run ()
+        assert (tmp_path / 'o.txt').read_text () == 'a\n1\n2\n3\n4\n5\n'
+        # The resumed run writes less than the first run
+        (tmp_path / 'n.txt').write_text ('1\n')
+        bas = Interpreter (options (['']), program = prg)
+        bas.restore ('ck.pkl')
+        bas.run ()
+        assert (tmp_path / 'o.txt').read_text () == 'a\n1\n'
+    # end def test_checkpoint_output
+
     def test_hex (self):
         """
             10 PRINT &HFF
@@ -281,6 +631,16 @@ class Test_Base (_Test_Common):
         self.run_test (r)
     # end def test_str
 
+    def test_fn_params (self):
+        """
+            10 X = 5: DEF FNSQ(X) = X * X + Y
+            20 DEF FNHYP(X, Y) = SQR (FNSQ(X) + FNSQ(Y))
+            30 Y = 0: PRINT FNHYP(3, 4); X; Y
+            40 Y = 1: PRINT FNSQ(FNSQ(2)); X
+        """
+        self.run_test (' 5 5 0\n 26 5\n')
+    # end def test_fn_params
+
     def test_while (self):
         """
             10 I=0
@@ -302,6 +662,17 @@ class Test_Base (_Test_Common):
         self.run_test (' 1\n 2\n 3\n 4\n 5\n', self.stack_hook)
     # end def test_while_single_line
 
+    def test_deep_gosub (self):
+        """
+            10 N = 3000: GOSUB 100: PRINT D
+            20 END
+            100 D = D + 1: IF D < N THEN GOSUB 100: RETURN
+            110 RETURN
+        """
+        self.pystack = None
+        self.run_test (' 3000\n', self.stack_hook)
+    # end def test_deep_gosub
+
     def test_input (self):
         """
             5 LOCATE 1,1
@@ -320,6 +691,38 @@ class Test_Base (_Test_Common):
         self.run_test (s, opt = opt)
     # end def test_input
 
+    def test_input_file (self, tmp_path):
+        """
+            10 FOR I=1 TO 3: LINE INPUT; K$: PRINT K$: NEXT I
+            20 PRINT LEN (K$)
+        """
+        fn = tmp_path / 'input.txt'
+        fn.write_text ('one\ntw')
+        opt = ['-i', str (fn), '-k', 'o\\nthree', '']
+        self.run_test ('one\none\ntwo\ntwo\nthree\nthree\n5\n', opt = opt)
+    # end def test_input_file
+
+    def test_input_close (self, tmp_path):
+        """
+            10 LINE INPUT; K$: PRINT K$
+        """
+        fn = tmp_path / 'input.txt'
+        fn.write_text ('one\ntwo\n')
+        args = options (['-i', str (fn), ''])
+        prg  = dedent (self.test_input_close.__doc__).split ('\n')
+        bas  = Interpreter (args, program = prg)
+        f    = bas.kinput.sources [0]
+        bas.run ()
+        assert f.closed
+        kinput = bas.read_kinput (str (fn))
+        f      = kinput.sources [0]
+        bas.reset (kinput, StringIO ())
+        bas.reset (kinput, StringIO ())
+        assert not f.closed
+        bas.reset (ofile = StringIO ())
+        assert f.closed
+    # end def test_input_close
+
 # end class Test_Base
 
 @pytest.mark.skipif (asm is None, reason = 'Need unicorn, keystone, capstone')
@@ -475,6 +878,186 @@ class Test_MBF:
 
 # end class Test_MBF
 
+class Test_Format:
+    """ Compare format_float with the original implementation on a
+        randomized corpus of numbers.
+    """
+
+    def legacy_fmt (self, v, fmt = '{:#.9g}'):
+        sign = ''
+        if fmt.startswith ('{'):
+            x = fmt.format (v).strip ()
+        else:
+            x = (fmt % v).strip ()
+        if x.startswith ('-'):
+            sign = '-'
+            x = x.lstrip ('-')
+        x = x.lstrip ('0')
+        x = sign + x
+        if '.' in x and not 'e' in x and not 'E' in x:
+            x = x.rstrip ('0')
+            x = x.rstrip ('.')
+        return x
+    # end def legacy_fmt
+
+    def legacy_format_float (self, v):
+        if v == 0.0:
+            return ' 0'
+        e = int (np.floor (np.log10 (np.abs (v))))
+        x = self.legacy_fmt (v)
+        f = '{:#.8g}'
+        if -3 <= e <= -1:
+            f = '%.8f'
+        if abs (e) > 8 or len (x) >= 8 and e < -3:
+            f = '%12E'
+        v = self.legacy_fmt (v, fmt = f)
+        if not v.startswith ('-'):
+            v = ' ' + v
+        return v
+    # end def legacy_format_float
+
+    def corpus (self, n = 20000):
+        rnd = random.Random (4711)
+        for i in range (n):
+            e = rnd.randint (-12, 12)
+            m = rnd.choice \
+                ( ( rnd.random (), round (rnd.random (), 3), 1
+                  , 1 - rnd.random () * 1e-9
+                  )
+                )
+            v = rnd.choice ((1, -1)) * m * 10.0 ** e
+            yield v
+            yield np.single (v)
+            yield rnd.randint (-100000, 100000)
+    # end def corpus
+
+    def test_format_float (self):
+        for v in self.corpus ():
+            assert format_float (v) == self.legacy_format_float (v), repr (v)
+    # end def test_format_float
+
+# end class Test_Format
+
+class Test_Batch:
+
+    def test_run_job (self, tmp_path):
+        prg = tmp_path / 'double.bas'
+        prg.write_text ('10 INPUT X\n20 PRINT X*2\n')
+        loop = tmp_path / 'loop.bas'
+        loop.write_text ('10 GOTO 10\n')
+        for n in range (2):
+            out = tmp_path / ('%d.out' % n)
+            job = dict \
+                (id = n, args = [str (prg), '-k', '%d\n' % n], output = str (out))
+            r = batch.run_job (job)
+            assert r ['status'] == 'ok'
+            assert r ['cached'] == bool (n)
+            assert out.read_text ().endswith (' %d\n' % (2 * n))
+        job = dict (id = 'loop', args = [str (loop)])
+        r = batch.run_job (job, timeout = 0.2)
+        assert r ['status'] == 'timeout'
+        job = dict (id = 'bad', args = [str (loop), '--no-such-option'])
+        r = batch.run_job (job)
+        assert r ['status'] == 'exception'
+    # end def test_run_job
+
+    def test_exit_status (self, tmp_path):
+        ok  = tmp_path / 'ok.bas'
+        ok.write_text ('10 PRINT 1\n')
+        bad = tmp_path / 'bad.bas'
+        bad.write_text ('10 PRINT 1\n20 FOO BAR\n')
+        out = str (tmp_path / 'out')
+        assert yabasi.bas.main ([str (ok), '-o', out]) == 0
+        assert yabasi.bas.main ([str (bad), '-o', out]) == 1
+        manifest = tmp_path / 'jobs.jsonl'
+        manifest.write_text (json.dumps (dict (args = [str (bad)])) + '\n')
+        argv = [str (manifest), '-o', str (tmp_path / 'summary.jsonl')]
+        assert batch.main (argv) == 1
+    # end def test_exit_status
+
+    def test_fork (self, tmp_path):
+        prg = tmp_path / 'double.bas'
+        prg.write_text ('10 INPUT X\n20 PRINT X*2\n')
+        manifest = tmp_path / 'jobs.jsonl'
+        summary  = tmp_path / 'summary.jsonl'
+        with open (manifest, 'w') as f:
+            for n in range (3):
+                out = tmp_path / ('%d.out' % n)
+                job = dict \
+                    (args = [str (prg), '-k', '%d\n' % n], output = str (out))
+                print (json.dumps (job), file = f)
+        argv = [str (manifest), '--fork', '-j', '2', '-o', str (summary)]
+        assert batch.main (argv) == 0
+        with open (summary) as f:
+            results = [json.loads (line) for line in f]
+        assert len (results) == 3
+        assert all (r ['cached'] for r in results)
+        for n in range (3):
+            out = tmp_path / ('%d.out' % n)
+            assert out.read_text ().endswith (' %d\n' % (2 * n))
+    # end def test_fork
+
+# end class Test_Batch
+
+class Test_API:
+
+    def test_run (self, tmp_path, monkeypatch):
+        """ Files are only read and written in memory
+        """
+        prg = dedent \
+            ("""
+            10 OPEN "IN.TXT" FOR INPUT AS #1
+            20 INPUT #1, N
+            30 CLOSE #1
+            40 DIM A(N)
+            50 FOR I=1 TO N: A(I)=I*I: NEXT I
+            60 OPEN "OUT.DAT" FOR OUTPUT AS #2 LEN=4
+            70 FIELD #2, 4 AS X$
+            80 INPUT "M";M
+            90 LSET X$=MKS$(A(N)*M): PUT #2: CLOSE #2
+            100 PRINT A(N)
+            110 KILL "IN.TXT"
+            """)
+        monkeypatch.chdir (tmp_path)
+        files = {'IN.TXT': b'3\r\n'}
+        r = api.run (prg, inputs = ['2'], files = files)
+        assert not r.error
+        assert r.output == 'M: 2\n 9\n'
+        assert list (r.arrays ['A']) == [0, 1, 4, 9]
+        assert r.variables ['M'] == 2
+        assert r.files == {'OUT.DAT': np.single (18).tobytes ()}
+        assert files == {'IN.TXT': b'3\r\n'}
+        assert os.listdir (tmp_path) == []
+    # end def test_run
+
+    def test_limits (self):
+        prg = '10 I=I+1\n20 FOR J=1 TO 1E9: NEXT J\n'
+        r = api.run (prg, max_statements = 100)
+        assert r.status == 'max-statements'
+        assert r.statements == 100
+        assert r.line == 20
+        assert r.variables ['I'] == 1
+        r = api.run (prg, timeout = 0.05)
+        assert r.status == 'timeout'
+        assert r.line == 20
+        r = api.run ('10 PRINT 1/0\n')
+        assert r.status == 'error'
+        assert r.statements == 1
+    # end def test_limits
+
+    def test_threads (self):
+        prg = '10 INPUT K: DIM A(2)\n20 FOR I=1 TO 2000: A(1)=A(1)+K: NEXT I\n'
+        def run (k):
+            return api.run (prg, inputs = [str (k)])
+        with ThreadPoolExecutor (max_workers = 4) as pool:
+            results = list (pool.map (run, range (8)))
+        for k, r in enumerate (results):
+            assert r.variables ['K'] == k
+            assert r.arrays ['A'][1] == 2000 * k
+    # end def test_threads
+
+# end class Test_API
+
 class Test_Graphics (_Test_Common):
 
     default_opt = ['-S', 'tkinter', '']
@@ -585,6 +1168,26 @@ class Test_Graphics (_Test_Common):
         self.run_test (opt = opt, capture = True)
     # end def test_canvas_input
 
+    def text_hook (self, interpreter):
+        self.interpreter = interpreter
+    # end def text_hook
+
+    def test_text_buffer (self):
+        """
+            10 CLS
+            20 FOR I=1 TO 26: PRINT "ROW";I: NEXT I
+            30 COLOR 4,0: PRINT "RED";
+            40 COLOR 0,7: PRINT "GREY"
+            50 COLOR 4,0: PRINT "RED AGAIN"
+            60 LOCATE 1,1: PRINT "NEW";
+            70 LOCATE 5,10: PRINT "X"
+        """
+        opt = ['--enable-text-color'] + self.default_opt
+        self.run_test (hook = self.text_hook, opt = opt, capture = True)
+        # One tag per color combination: default, red/black, black/grey
+        assert len (self.interpreter.screen.attr_tags) == 3
+    # end def test_text_buffer
+
 # end class Test_Graphics
 
 class Test_Doctest:
@@ -606,7 +1209,7 @@ class Test_Doctest:
     # end def run_test
 
     def test_bas (self):
-        num_tests = 22
+        num_tests = 67
         self.run_test (yabasi.bas, num_tests)
     # end def test_bas
 
@@ -615,4 +1218,9 @@ class Test_Doctest:
         self.run_test (yabasi.mbf, num_tests)
     # end def test_mbf
 
+    def test_api (self):
+        num_tests = 3
+        self.run_test (api, num_tests)
+    # end def test_api
+
 # end class Test_Doctest
@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+# Copyright (C) 2024-25 Dr. Ralf Schlatterbeck Open Source Consulting.
+# Reichergasse 131, A-3411 Weidling.
+# Web: http://www.runtux.com Email: office@runtux.com
+# All rights reserved
+# ****************************************************************************
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ****************************************************************************
+
+""" Run BASIC programs from Python
+    >>> r = run ('10 INPUT A\\n20 PRINT A*2\\n', inputs = ['21'])
+    >>> r.output
+    ': 21\\n 42\\n'
+    >>> r.variables ['A']
+    21.0
+"""
+
+import functools
+import threading
+import numpy as np
+from io import StringIO
+from .bas import Interpreter, Key_Input, Memory_Filesystem, options
+
+class Result:
+    """ Result of a run: The printed output, the variables and arrays
+        (as numpy arrays) at the end of the run, the contents of all
+        files (as bytes) and a flag if the run ended with an error.
+        The status is 'ok', 'error', 'max-statements' or 'timeout',
+        line is the BASIC line reached and statements the number of
+        lines executed.
+    """
+
+    def __init__ (self, output, variables, arrays, files, error, status):
+        self.output     = output
+        self.variables  = variables
+        self.arrays     = arrays
+        self.files      = files
+        self.error      = error
+        self.status     = status ['status']
+        self.line       = status ['line']
+        self.statements = status ['statements']
+    # end def __init__
+
+# end class Result
+
+@functools.lru_cache (maxsize = 32)
+def compile_program (source, opts):
+    """ Compiled programs are cached, a program is parsed only once
+        for the same source and options. The compiled program is bound
+        to its interpreter, the returned lock serializes runs of the
+        interpreter from several threads.
+    """
+    args = options (list (opts) + [''])
+    return Interpreter (args, program = source), threading.Lock ()
+# end def compile_program
+
+def run \
+    ( program, inputs = None, files = None, options = ()
+    , max_statements = None, timeout = None
+    ):
+    """ Run a BASIC program given as a string or an iterable of lines.
+        The inputs are the keyboard input, either a string or a list
+        of lines. The files map file names to their contents as
+        bytes, all file operations of the program use these instead
+        of the real filesystem. The options are the command-line
+        options of yabasi, e.g. ['-s'] for single precision.
+        The run is stopped after max_statements lines or after
+        timeout seconds.
+    """
+    if isinstance (program, str):
+        program = program.splitlines ()
+    if inputs is not None and not isinstance (inputs, str):
+        inputs = Key_Input.from_lines (inputs)
+    bas, lock = compile_program (tuple (program), tuple (options))
+    out = StringIO ()
+    fs  = Memory_Filesystem (files)
+    with lock:
+        bas.reset (inputs, out, fs)
+        bas.max_statements = max_statements
+        bas.timeout        = timeout
+        bas.run ()
+        bas.close_files ()
+        # The next run re-uses the interpreter: Copy its state
+        return Result \
+            ( out.getvalue ()
+            , dict (bas.var)
+            , {k: np.array (a) for k, a in bas.dim.items ()}
+            , fs.files
+            , bas.err_seen
+            , bas.run_status ()
+            )
+# end def run
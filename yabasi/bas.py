@@ -25,10 +25,12 @@
 
 from ply import yacc
 from argparse import ArgumentParser
-from io import StringIO
+from io import StringIO, BytesIO, TextIOWrapper, UnsupportedOperation
 from PIL import Image, ImageTk, ImageGrab
-from math import prod
+from math import prod, floor, log10
+from collections import deque
 import operator
+import re
 import itertools
 import tkinter
 import numpy as np
@@ -37,10 +39,24 @@ import os
 import datetime
 import struct
 import copy
+import asyncio
+import errno
+import functools
+import mmap
+import pickle
+import signal
+import stat
+import tempfile
 import logging
 import time
 from . import tokenizer, __version__
 from .mbf import MBF_Float
+try:
+    # Variable-width strings stored in the array, numpy >= 2.0
+    from numpy.dtypes import StringDType
+    string_dtype = StringDType ()
+except ImportError:
+    string_dtype = object
 
 def setup_log ():
     logging.basicConfig \
@@ -159,27 +175,27 @@ def fun_string (count, s):
     return chr (s) * int (count)
 # end def fun_string
 
-#def _fmt_float (v, fmt = '%9f'):
-def _fmt_float (v, fmt = '{:#.9g}'):
-    sign = ''
-    if fmt.startswith ('{'):
-        x = fmt.format (v).strip ()
-    else:
-        x = (fmt % v).strip ()
-    if x.startswith ('-'):
+def _strip_float (x):
+    """ Remove leading zeros and, for numbers without exponent,
+        trailing zeros of the fraction, prefix a blank for
+        positive numbers.
+    """
+    sign = ' '
+    if x [0] == '-':
         sign = '-'
-        x = x.lstrip ('-')
+        x    = x [1:]
     x = x.lstrip ('0')
-    x = sign + x
-    if '.' in x and not 'e' in x and not 'E' in x:
-        x = x.rstrip ('0')
-        x = x.rstrip ('.')
-    return x
-# end def _fmt_float
+    if '.' in x and 'e' not in x and 'E' not in x:
+        x = x.rstrip ('0').rstrip ('.')
+    return sign + x
+# end def _strip_float
 
 def format_float (v):
     """ Try to get float formatting right
         (or at least matching to pcbasic)
+        The decimal exponent decides the format, it is computed in
+        single precision for single precision numbers. Each number
+        is formatted only once.
     >>> format_float (0.0)
     ' 0'
     >>> format_float (0.001)
@@ -204,38 +220,246 @@ def format_float (v):
     ' .0099475'
     >>> format_float (-.16039812)
     '-.16039812'
+    >>> format_float (1234567890.0)
+    ' 1.234568E+09'
+    >>> format_float (np.single (0.1))
+    ' .1'
+    >>> format_float (.00012345678)
+    ' 1.234568E-04'
+    >>> format_float (.0001)
+    ' .0001'
     """
     if v == 0.0:
         return ' 0'
-    e = int (np.floor (np.log10 (np.abs (v))))
-    x = _fmt_float (v)
-    f = '{:#.8g}'
+    if isinstance (v, np.single):
+        e = int (np.floor (np.log10 (abs (v))))
+    else:
+        e = floor (log10 (abs (v)))
+    if e > 8 or e < -8:
+        return _strip_float ('%E' % v)
     if -3 <= e <= -1:
-        f = '%.8f'
-    if abs (e) > 8 or len (x) >= 8 and e < -3:
-        f = '%12E'
-    v = _fmt_float (v, fmt = f)
-    if not v.startswith ('-'):
-        v = ' ' + v
-    return v
+        return _strip_float ('%.8f' % v)
+    if e < -3:
+        # Numbers with many digits use exponential format
+        x = _strip_float ('{:#.9g}'.format (v))
+        if len (x.lstrip ()) >= 8:
+            return _strip_float ('%E' % v)
+    return _strip_float ('{:#.8g}'.format (v))
 # end def format_float
 
+def format_write (v):
+    """ Format a value for WRITE: Strings are quoted, numbers have
+        no leading blank.
+    >>> format_write (np.single (1.5))
+    '1.5'
+    >>> format_write (-0.25)
+    '-.25'
+    >>> format_write (7)
+    '7'
+    >>> format_write ('abc')
+    '"abc"'
+    """
+    if isinstance (v, str):
+        return '"' + v + '"'
+    if isinstance (v, (float, np.floating)):
+        return format_float (v).lstrip (' ')
+    return str (v)
+# end def format_write
+
+class Input_Pending (Exception):
+    """ Raised when the program needs keyboard input that is not yet
+        available when running as a coroutine.
+    """
+
+    def __init__ (self, prompt):
+        self.prompt = prompt
+    # end def __init__
+
+# end class Input_Pending
+
+class Key_Input:
+    """ Keyboard input given in advance, read by lines or by
+        characters from the given text streams (read in turn, e.g.,
+        an input file followed by a key string). The streams are read
+        incrementally and never copied. As with splitting the whole
+        input at newlines, the text after the last newline is a last
+        (possibly empty) line.
+    >>> k = Key_Input (StringIO ('a\\nbc\\nd'), StringIO ('e\\n'))
+    >>> k.readline (), k.getc (), k.getc (), k.getc (), k.readline ()
+    ('a', 'b', 'c', '\\n', 'de')
+    >>> k.readline (), k.readline ()
+    ('', None)
+    >>> k = Key_Input.from_lines (['1', '2'])
+    >>> k.readline (), k.readline (), k.readline ()
+    ('1', '2', None)
+    >>> Key_Input (StringIO ('')).readline ()
+    """
+
+    def __init__ (self, *sources):
+        self.sources = deque (sources)
+        self.nread   = 0
+        self.at_end  = False
+    # end def __init__
+
+    @classmethod
+    def from_lines (cls, lines):
+        """ Input consisting of exactly the given lines """
+        k = cls (StringIO (''.join (l + '\n' for l in lines)))
+        k.at_end = True
+        return k
+    # end def from_lines
+
+    def __getstate__ (self):
+        """ The remaining input is saved as a string """
+        rest  = ''.join (src.read () for src in self.sources)
+        self.close ()
+        self.sources = deque ([StringIO (rest)])
+        state = dict (self.__dict__)
+        state ['sources'] = rest
+        return state
+    # end def __getstate__
+
+    def __setstate__ (self, state):
+        self.__dict__.update (state)
+        self.sources = deque ([StringIO (state ['sources'])])
+    # end def __setstate__
+
+    def close (self):
+        while self.sources:
+            self.sources.popleft ().close ()
+    # end def close
+
+    def getc (self):
+        """ Next character, empty at end of input """
+        while self.sources:
+            c = self.sources [0].read (1)
+            if c:
+                self.nread += 1
+                return c
+            self.sources.popleft ().close ()
+        return ''
+    # end def getc
+
+    def readline (self):
+        """ Next line without newline, None at end of input """
+        line = ''
+        while self.sources:
+            l = self.sources [0].readline ()
+            self.nread += len (l)
+            line += l
+            if l.endswith ('\n'):
+                return line [:-1]
+            self.sources.popleft ().close ()
+        if self.at_end or not self.nread:
+            return None
+        self.at_end = True
+        return line
+    # end def readline
+
+# end class Key_Input
+
+class Output_Buffer:
+    """ Collect output strings and write them to the underlying file
+        in large chunks. A size of 0 writes through immediately.
+    >>> f = StringIO ()
+    >>> ob = Output_Buffer (f, 8)
+    >>> ob.write ('abc')
+    >>> f.getvalue ()
+    ''
+    >>> ob.write ('defgh')
+    >>> f.getvalue ()
+    'abcdefgh'
+    """
+
+    def __init__ (self, f, size = 65536):
+        self.f     = f
+        self.size  = size
+        self.parts = []
+        self.count = 0
+    # end def __init__
+
+    def flush (self):
+        if self.parts:
+            self.f.write (''.join (self.parts))
+            self.parts = []
+            self.count = 0
+        self.f.flush ()
+    # end def flush
+
+    def write (self, s):
+        if not self.size:
+            self.f.write (s)
+            return
+        self.parts.append (s)
+        self.count += len (s)
+        if self.count >= self.size:
+            self.flush ()
+    # end def write
+
+# end class Output_Buffer
+
+def as_key_input (kinput):
+    """ Keyboard input may also be given as a string """
+    if isinstance (kinput, str):
+        return Key_Input (StringIO (kinput))
+    return kinput
+# end def as_key_input
+
 class Screen:
     """ Default screen emulation doing essentially nothing
     """
 
+    # Set if a display refresh was skipped due to the refresh rate
+    pending = False
+
     def __init__ (self, parent, kinput = None, ofile = None):
         self.parent = parent
-        self.ofile  = ofile or sys.stdout
-        self.kinput = None
-        if kinput:
-            self.kinput = kinput.split ('\n')
+        self.set_io (kinput, ofile)
     # end def __init__
 
     def dump_contents (self, test):
         pass
     # end def dump_contents
 
+    def flush (self):
+        self.ofile.flush ()
+    # end def flush
+
+    def get_state (self):
+        """ Screen state saved in a checkpoint of the interpreter """
+        self.flush ()
+        return dict \
+            ( kinput   = self.kinput
+            , consumed = self.consumed
+            , replay   = self.replay
+            )
+    # end def get_state
+
+    def refresh (self, force = False):
+        """ Bring the display up to date, nothing to do here """
+        pass
+    # end def refresh
+
+    def set_state (self, state):
+        """ Restore screen state from a checkpoint, output continues
+            to the current output file.
+        """
+        self.kinput   = state ['kinput']
+        self.consumed = state ['consumed']
+        self.replay   = state ['replay']
+    # end def set_state
+
+    def set_io (self, kinput = None, ofile = None):
+        """ Set keyboard input and output file, used when the screen
+            is re-used for another run of the program.
+        """
+        self.ofile  = Output_Buffer \
+            (ofile or sys.stdout, self.parent.args.output_buffer_size)
+        self.kinput   = as_key_input (kinput)
+        self.consumed = []
+        self.replay   = 0
+    # end def set_io
+
     # Commands
 
     def cmd_circle (self, x, y, r, opt):
@@ -256,12 +480,22 @@ class Screen:
     # end def cmd_get_graphics
 
     def cmd_input (self, prompt):
-        if self.kinput:
+        value = None
+        if self.kinput is not None:
+            value = self.kinput.readline ()
+        if value is not None:
+            self.consumed.append (value)
+            if self.replay:
+                # Already echoed before the statement was interrupted
+                self.replay -= 1
+                return value
             self.cmd_print (prompt, end = '')
-            value = self.kinput.pop (0)
             self.cmd_print (value)
             return value
+        elif self.parent.async_mode:
+            raise Input_Pending (prompt)
         else:
+            self.flush ()
             return input (prompt)
     # end def cmd_input
 
@@ -281,7 +515,9 @@ class Screen:
     # end def cmd_locate
 
     def cmd_print (self, s, end = None):
-        print (s, end = end, file = self.ofile)
+        if end is None:
+            end = '\n'
+        self.ofile.write (s + end)
     # end def cmd_print
 
     def cmd_pset (self, x, y):
@@ -323,6 +559,109 @@ class Screen:
 
 # end class Screen
 
+class Text_Buffer:
+    """ Character cells of the emulated text screen: Characters are
+        stored as unicode code points, attributes as an index into a
+        table of colors maintained by the screen. Rows modified since
+        the last display update are marked dirty.
+    >>> tb = Text_Buffer (2, 4)
+    >>> tb.put (0, 0, 'abcde', '', 0)
+    (1, 1)
+    >>> tb.put (1, 1, 'xy', '\\n', 1)
+    (1, 0)
+    >>> tb.text ()
+    'exy     '
+    >>> list (tb.row_runs (0))
+    [('e', 0), ('xy ', 1)]
+    >>> tb.put (0, 0, 'XXXX', '', 0)
+    (1, 0)
+    >>> tb.put (0, 0, 'AB', '\\n', 0)
+    (1, 0)
+    >>> tb.text ()
+    'AB      '
+    """
+
+    def __init__ (self, rows, cols):
+        self.rows  = rows
+        self.cols  = cols
+        self.size  = rows * cols
+        self.chars = np.full (self.size, ord (' '), dtype = np.uint32)
+        self.attrs = np.zeros (self.size, dtype = np.uint8)
+        self.dirty = np.ones (rows, dtype = bool)
+    # end def __init__
+
+    def clear (self, attr = 0):
+        self.chars [:] = ord (' ')
+        self.attrs [:] = attr
+        self.dirty [:] = True
+    # end def clear
+
+    def put (self, row, col, s, end, attr):
+        """ Write s at the given position, end is the line terminator
+            following s (if any). Scroll if necessary and return the
+            new cursor position.
+        """
+        pos = row * self.cols + col
+        dl  = pos + len (s)
+        if dl > self.size:
+            n    = (dl - self.size + self.cols - 1) // self.cols
+            self.scroll (n, attr)
+            pos -= n * self.cols
+            dl  -= n * self.cols
+            if pos < 0:
+                s   = s [-pos:]
+                pos = 0
+        if dl > pos:
+            cp = np.frombuffer (s.encode ('utf-32-le'), dtype = np.uint32)
+            self.chars [pos:dl] = cp
+            self.attrs [pos:dl] = attr
+            self.dirty [pos // self.cols:(dl - 1) // self.cols + 1] = True
+        # Newline must clear to eol
+        if end == '\n' and dl < self.size:
+            eol = (dl // self.cols + 1) * self.cols
+            self.chars [dl:eol] = ord (' ')
+            self.attrs [dl:eol] = attr
+            self.dirty [dl // self.cols] = True
+        if end == '\r':
+            row, col = dl // self.cols, 0
+        elif end == '\n':
+            row, col = dl // self.cols + 1, 0
+        else:
+            row, col = divmod (dl, self.cols)
+        if row > self.rows - 1:
+            self.scroll (row - self.rows + 1, attr)
+            row = self.rows - 1
+        return row, col
+    # end def put
+
+    def row_runs (self, row):
+        """ Yield text of given row in runs of same attribute """
+        pos   = row * self.cols
+        attrs = self.attrs [pos:pos + self.cols]
+        text  = self.chars [pos:pos + self.cols].tobytes ().decode ('utf-32-le')
+        start = 0
+        for brk in np.flatnonzero (attrs [1:] != attrs [:-1]):
+            yield text [start:brk + 1], int (attrs [start])
+            start = brk + 1
+        yield text [start:], int (attrs [start])
+    # end def row_runs
+
+    def scroll (self, n, attr):
+        """ Scroll up by n rows, new rows get the given attribute """
+        k = min (n, self.rows) * self.cols
+        self.chars [:self.size - k] = self.chars [k:]
+        self.attrs [:self.size - k] = self.attrs [k:]
+        self.chars [self.size - k:] = ord (' ')
+        self.attrs [self.size - k:] = attr
+        self.dirty [:] = True
+    # end def scroll
+
+    def text (self):
+        return self.chars.tobytes ().decode ('utf-32-le')
+    # end def text
+
+# end class Text_Buffer
+
 class Screen_Tkinter (Screen):
     """ A tkinter based screen emulation
     """
@@ -348,9 +687,13 @@ class Screen_Tkinter (Screen):
 
     def __init__ (self, parent, kinput = None, ofile = None):
         self.parent    = parent
-        self.kinput    = kinput
+        self.kinput    = as_key_input (kinput)
         self.ofile     = ofile
         self.scr_mode  = 0
+        self.last_upd  = 0.0
+        self.upd_delay = 0.0
+        if parent.args.refresh_rate > 0:
+            self.upd_delay = 1.0 / parent.args.refresh_rate
         self.win_root  = tkinter.Tk ()
         self.win_root.protocol ('WM_DELETE_WINDOW', self.on_close)
         self.rows      = 25
@@ -375,42 +718,46 @@ class Screen_Tkinter (Screen):
         self.win_text.configure (width  = self.cols)
         self.win_text.configure (height = self.rows)
         self.win_text.configure (state = 'disabled')
+        self.win_text.tag_config ('cursor', background = 'yellow')
+        self.text_buf  = None
+        self.attr_idx  = {}
+        self.attr_tags = []
         self.clear_text_screen ()
         self.win_text.pack ()
         self.win_root.update ()
-        self.keys   = []
+        # Key events, read after the keyboard input given in advance
+        self.keys   = deque ()
         self.funkey = ['', '', '', '', '', '', '', '', '', '']
         self.win_root.bind ("<Key>", self.keyhandler)
-        if self.kinput:
-            self.keys.extend (self.kinput)
     # end def __init__
 
     def clear_graphics_screen (self):
         if self.canvas:
             self.canvas.delete ('all')
-            self.win_root.update ()
         self.g_images = []
         self.cur_row = self.cur_col = 0
-        self.win_root.update ()
+        self.refresh ()
     # end def clear_graphics_screen
 
     def clear_text_screen (self):
-        self.win_text.configure (state = 'normal')
-        self.win_text.delete ('1.0', 'end')
-        self.win_text.insert ('end', ' ' * (self.rows * self.cols))
-        self.win_text.tag_add ('0', '1.0', '1.%d' % (self.rows * self.cols))
-        self.win_text.tag_config \
-            ('0', background = self.text_bg, foreground = self.text_fg)
-        self.win_text.configure (state = 'disabled')
+        tb = self.text_buf
+        if tb is None or tb.rows != self.rows or tb.cols != self.cols:
+            tb = self.text_buf = Text_Buffer (self.rows, self.cols)
+            self.win_text.configure (state = 'normal')
+            self.win_text.delete ('1.0', 'end')
+            self.win_text.insert ('end', ' ' * (self.rows * self.cols))
+            self.win_text.configure (state = 'disabled')
+        tb.clear (self.text_attr ())
         self.cur_row = self.cur_col = 0
         self.update_cursor ()
-        self.win_root.update ()
+        self.refresh ()
     # end def clear_text_screen
 
     def dump_contents (self, test):
         """ Dump contents of text or graphics screen (depending on
             current graphics mode) to the test object
         """
+        self.refresh (force = True)
         if self.scr_mode == 0:
             test.cap_txt = self.win_text.get ('1.0', 'end')
         else:
@@ -419,10 +766,35 @@ class Screen_Tkinter (Screen):
             test.cap_img = self.canvas.postscript ()
     # end def dump_contents
 
+    def flush (self):
+        pass
+    # end def flush
+
     def get_bufpos (self):
         return self.cur_row * self.cols + self.cur_col
     # end def get_bufpos
 
+    def get_state (self):
+        """ The text screen is saved with the attributes of each
+            character, graphics are not saved.
+        """
+        tb    = self.text_buf
+        attrs = sorted (self.attr_idx, key = self.attr_idx.get)
+        return dict \
+            ( kinput  = self.kinput
+            , keys    = list (self.keys)
+            , rows    = self.rows
+            , cols    = self.cols
+            , cur_row = self.cur_row
+            , cur_col = self.cur_col
+            , text_fg = self.text_fg
+            , text_bg = self.text_bg
+            , attrs   = attrs
+            , chars   = tb.chars.copy ()
+            , attr    = tb.attrs.copy ()
+            )
+    # end def get_state
+
     def get_canvas_rectangle (self, x0, y0, x1, y1):
         """ This is a hack: It screen-grabs the rectangle. So if the
             canvas is obscured by another window this will yield very
@@ -435,6 +807,8 @@ class Screen_Tkinter (Screen):
             would need to take it into account
             This returns a boolean numpy array.
         """
+        # We read back from the screen, so it must reflect all drawing
+        self.refresh (force = True)
         # Not sure if we can somehow find out the width of the canvas border
         xw = self.win_root.winfo_rootx () + self.canvas.winfo_x () + 1
         yw = self.win_root.winfo_rooty () + self.canvas.winfo_y () + 1
@@ -448,7 +822,7 @@ class Screen_Tkinter (Screen):
             self.canvas = tkinter.Canvas \
                 (self.win_root, width = self.g_width, height = self.g_height)
         self.canvas.pack ()
-        self.win_root.update ()
+        self.refresh (force = True)
         self.clear_graphics_screen ()
     # end def init_canvas
 
@@ -463,22 +837,105 @@ class Screen_Tkinter (Screen):
         self.win_root.update_idletasks ()
     # end def on_close
 
+    def refresh (self, force = False):
+        """ Updating the tkinter window after each drawing command is
+            very slow for programs drawing many primitives. So we
+            limit the update to the configured refresh rate unless
+            forced, e.g., when waiting for keyboard input. A skipped
+            update is marked pending, the interpreter calls us again
+            while an update is pending so that the display is never
+            more than one refresh period behind.
+        """
+        now = time.monotonic ()
+        if force or now - self.last_upd >= self.upd_delay:
+            if self.scr_mode == 0:
+                self.sync_text ()
+            self.win_root.update ()
+            self.last_upd = now
+            self.pending  = False
+        else:
+            self.pending  = True
+    # end def refresh
+
     def screen_coords (self, point):
         g_mul = np.array ([self.g_xmul, self.g_ymul])
         g_off = np.array ([self.g_xoff, self.g_yoff])
         return (point * g_mul + g_off).astype (int)
     # end def screen_coords
 
-    def update_cursor (self):
+    def set_state (self, state):
         if self.scr_mode != 0:
-            return
-        self.win_text.tag_delete ('cursor')
+            self.scr_mode = 0
+            if self.canvas:
+                self.canvas.forget ()
+            self.win_label.pack ()
+        if (self.rows, self.cols) != (state ['rows'], state ['cols']):
+            self.rows = state ['rows']
+            self.cols = state ['cols']
+            self.win_text.configure (state = 'normal')
+            self.win_text.configure (width = self.cols, height = self.rows)
+        self.clear_text_screen ()
+        # Attribute indices are re-created in the order of the snapshot
+        remap = []
+        for self.text_fg, self.text_bg in state ['attrs']:
+            remap.append (self.text_attr ())
+        tb = self.text_buf
+        tb.chars [:] = state ['chars']
+        if remap:
+            tb.attrs [:] = np.array (remap, dtype = np.uint8) [state ['attr']]
+        tb.dirty [:] = True
+        self.kinput  = state ['kinput']
+        self.keys    = deque (state ['keys'])
+        self.text_fg = state ['text_fg']
+        self.text_bg = state ['text_bg']
+        self.cur_row = state ['cur_row']
+        self.cur_col = state ['cur_col']
+        self.update_cursor ()
+        self.refresh (force = True)
+    # end def set_state
+
+    def sync_text (self):
+        """ Transfer the dirty rows of the text buffer to the text
+            widget, each row is inserted with one call using one tag
+            per run of characters with the same attribute.
+        """
+        tb = self.text_buf
+        self.win_text.configure (state = 'normal')
+        for row in np.flatnonzero (tb.dirty):
+            args = []
+            for text, attr in tb.row_runs (row):
+                args.extend ((text, self.attr_tags [attr]))
+            pos = row * tb.cols
+            self.win_text.delete ('1.%d' % pos, '1.%d' % (pos + tb.cols))
+            self.win_text.insert ('1.%d' % pos, *args)
+        tb.dirty [:] = False
+        self.win_text.tag_remove ('cursor', '1.0', 'end')
         p = self.get_bufpos ()
         if self.v_cursor:
-            self.win_text.tag_add ('cursor', '1.%d' % p, '1.%d' % (p + 1))
             # bg color probably should depend on black vs white bg
-            self.win_text.tag_config ('cursor', background = 'yellow')
-        self.win_root.update ()
+            self.win_text.tag_add ('cursor', '1.%d' % p, '1.%d' % (p + 1))
+        self.win_text.configure (state = 'disabled')
+    # end def sync_text
+
+    def text_attr (self):
+        """ Attribute index of current text colors, each attribute
+            has its own tag in the text widget.
+        """
+        key = (self.text_fg, self.text_bg)
+        if key not in self.attr_idx:
+            tag = 'attr_%d' % len (self.attr_tags)
+            self.attr_idx [key] = len (self.attr_tags)
+            self.attr_tags.append (tag)
+            self.win_text.tag_config \
+                (tag, foreground = self.text_fg, background = self.text_bg)
+            self.win_text.tag_raise ('cursor')
+        return self.attr_idx [key]
+    # end def text_attr
+
+    def update_cursor (self):
+        if self.scr_mode != 0:
+            return
+        self.refresh ()
     # end def update_cursor
 
     # Commands called from outside
@@ -500,7 +957,7 @@ class Screen_Tkinter (Screen):
                 (lh, hi, rh, lo, start = start, extent = ext, style = 'arc')
         else:
             self.canvas.create_oval (lh, hi, rh, lo)
-        self.win_root.update ()
+        self.refresh ()
     # end def cmd_circle
 
     def cmd_cls (self, screen = None):
@@ -618,7 +1075,7 @@ class Screen_Tkinter (Screen):
             if 'F' in lineopt:
                 d.update (fill = 'black')
             self.canvas.create_rectangle (*pt1, *pt2, **d)
-        self.win_root.update ()
+        self.refresh ()
     # end def cmd_line
 
     def cmd_locate (self, row = None, col = None, exprlist = None):
@@ -656,7 +1113,7 @@ class Screen_Tkinter (Screen):
         y = self.cur_row * 8 * scrmode [3] + 1 # scale_y
         self.canvas.create_text (x, y, text = s, font = font, anchor = 'nw')
         self.cur_col += len (s)
-        self.win_root.update ()
+        self.refresh ()
     # end def cmd_print_canvas
 
     def cmd_print_text (self, s, end = None):
@@ -675,49 +1132,11 @@ class Screen_Tkinter (Screen):
             e [n] = '\r' * (len (v) - 1) + e [n]
         e = ''.join (e)
 
-        tlen = self.rows * self.cols
-        for n, (p, end) in enumerate (zip (itertools.chain (*s), e)):
-            pos  = self.get_bufpos ()
-            l    = len (p)
-            dl   = pos + l
-            wpos = '1.%d' % pos
-            epos = '1.%d' % (pos + l)
-            peol =  ((pos + l) // self.cols + 1)
-            eol  = '1.%d' % peol
-            self.win_text.configure (state = 'normal')
-            self.win_text.delete (wpos, epos)
-            self.win_text.insert (wpos, p)
-            # Newline must clear to eol
-            if end == '\n':
-                self.win_text.delete (epos, eol)
-                self.win_text.insert (epos, ' ' * (peol - (pos + l)))
-            tn = 'tag_%d' % pos
-            self.win_text.tag_add (tn, wpos, epos)
-            self.win_text.tag_config \
-                (tn, foreground = self.text_fg, background = self.text_bg)
-            # compute new cursor position
-            # last item does *not* have a newline
-            if end == '\r':
-                self.cur_col = 0
-                self.cur_row = dl // self.cols
-            elif end == '\n':
-                self.cur_col = 0
-                self.cur_row = dl // self.cols + 1
-            else:
-                self.cur_col = dl % self.cols
-                self.cur_row = dl // self.cols
-            if self.cur_row > self.rows - 1:
-                # Fill to eol
-                eol = self.cols - (dl % self.cols)
-                self.win_text.insert ('end', ' ' * eol)
-                # delete first lines(s)
-                ndel = (self.cur_row - self.rows + 1) * self.cols
-                assert ndel > 0
-                self.win_text.delete ('1.0', '1.%d' % ndel)
-                self.cur_row = self.rows - 1
-            self.update_cursor ()
-            self.win_text.configure (state = 'disabled')
-            self.win_root.update ()
+        attr = self.text_attr ()
+        for p, end in zip (itertools.chain (*s), e):
+            self.cur_row, self.cur_col = self.text_buf.put \
+                (self.cur_row, self.cur_col, p, end, attr)
+        self.update_cursor ()
     # end def cmd_print_text
 
     def cmd_pset (self, x, y):
@@ -772,7 +1191,7 @@ class Screen_Tkinter (Screen):
         self.canvas.create_image (cx, cy, anchor = 'nw', image = img)
         # Prevent images to be garbage-collected, tk doesn't keep a ref
         self.g_images.append (img)
-        self.win_root.update ()
+        self.refresh ()
     # end def cmd_put_graphics
 
     def cmd_screen (self, e1, e2, e3, e4):
@@ -782,7 +1201,7 @@ class Screen_Tkinter (Screen):
             if self.canvas:
                 self.canvas.forget ()
             self.win_label.pack ()
-            self.win_root.update ()
+            self.refresh (force = True)
             return
         if mode not in self.screen_mode:
             self.parent.raise_error ('Unsupported video mode: %s' % mode)
@@ -796,7 +1215,7 @@ class Screen_Tkinter (Screen):
         self.g_ymul   = sm [3]
         self.g_yoff   = 0
         self.init_canvas ()
-        self.win_root.update ()
+        self.refresh (force = True)
     # end def cmd_screen
 
     def cmd_width (self, ncols, nrows = None):
@@ -816,7 +1235,7 @@ class Screen_Tkinter (Screen):
                 changed = True
         if changed:
             self.clear_text_screen ()
-        self.win_root.update ()
+        self.refresh ()
     # end def cmd_width
 
     def cmd_window (self, x0, y0, x1, y1, is_screen = False):
@@ -848,11 +1267,13 @@ class Screen_Tkinter (Screen):
     # end def fun_csrlin
 
     def fun_inkey (self):
-        self.win_root.update ()
-        if self.keys:
-            v = self.keys.pop (0)
-            if isinstance (v, str):
+        self.refresh (force = True)
+        if self.kinput is not None:
+            v = self.kinput.getc ()
+            if v:
                 return v
+        if self.keys:
+            v = self.keys.popleft ()
             if len (v [0]) == 0:
                 if v [1].startswith ('F'):
                     n = int (v [1][1:])
@@ -874,22 +1295,28 @@ class Screen_Tkinter (Screen):
 # end class Screen_Tkinter
 
 class Print_Using:
-    """ Formatter for USING in a print statement
+    """ Formatter for USING in a print statement, the format string is
+        parsed once into a tuple of formats that is not modified when
+        formatting, use print_using to get a cached instance.
     >>> p = Print_Using ('###.##    ')
     >>> p.fmt
-    ['%6.2f    ']
+    ('%6.2f    ',)
     >>> p = Print_Using ('       ##.###^^^^')
     >>> p.fmt
-    ['       %.4E']
+    ('       %.4E',)
     >>> p = Print_Using ('   ###.##   ')
     >>> p.fmt
-    ['   %6.2f   ']
+    ('   %6.2f   ',)
     >>> p = Print_Using ('   ###.##')
     >>> p.fmt
-    ['   %6.2f']
+    ('   %6.2f',)
     >>> p = Print_Using ('###  ###   ##')
     >>> p.fmt
-    ['%3.0f  ', '%3.0f   ', '%2.0f']
+    ('%3.0f  ', '%3.0f   ', '%2.0f')
+    >>> [p.get (i) for i in range (4)]
+    ['%3.0f  ', '%3.0f   ', '%2.0f', '%2.0f']
+    >>> print_using ('###') is print_using ('###')
+    True
     """
 
     def __init__ (self, formatstring):
@@ -901,6 +1328,7 @@ class Print_Using:
         self.e   = 0
         self.fmt = []
         self.parse_format (formatstring)
+        self.fmt = tuple (self.fmt)
     # end def __init__
 
     def append_fmt (self):
@@ -916,13 +1344,11 @@ class Print_Using:
         self.f2 = []
     # end def append_fmt
 
-    def get (self):
-        # Formats can be re-used for multiple variables
-        if len (self.fmt) > 1:
-            f = self.fmt.pop (0)
-        else:
-            f = self.fmt [0]
-        return f
+    def get (self, idx):
+        """ Format for the item with the given index, the last format
+            is re-used for all remaining items
+        """
+        return self.fmt [min (idx, len (self.fmt) - 1)]
     # end def get
 
     def parse_format (self, v):
@@ -950,6 +1376,80 @@ class Print_Using:
 
 # end class Print_Using
 
+@functools.lru_cache (maxsize = 256)
+def print_using (formatstring):
+    return Print_Using (formatstring)
+# end def print_using
+
+class Data_Store:
+    """ Values of the DATA statements in the order of the program
+        lines. For RESTORE with a line number the offset of the
+        first value at or after each program line is indexed.
+        Numeric values are also kept in a float array for bulk
+        reads, with a running count of strings to check that a range
+        is numeric.
+    >>> data = {(10, 0): [1, 2.5], (30, 0): ['x', 4]}
+    >>> ds   = Data_Store (data, [(10, 0), (20, 0), (30, 0)])
+    >>> ds.offset (20), ds.offset (30)
+    (2, 2)
+    >>> ds.read (1, 2)
+    (2.5, 'x')
+    >>> ds.read_numeric (0, 2), ds.read_numeric (1, 2)
+    (array([1. , 2.5]), None)
+    >>> ds.read (3, 2)
+    Traceback (most recent call last):
+    IndexError: Out of DATA
+    >>> ds.offset (15)
+    Traceback (most recent call last):
+    KeyError: 'Undefined line number 15'
+    """
+
+    def __init__ (self, line_data, lines):
+        values      = []
+        self.index  = {}
+        for k in sorted (lines):
+            if k [1] == 0:
+                self.index [k [0]] = len (values)
+            values.extend (line_data.get (k, ()))
+        self.values  = tuple (values)
+        is_str       = np.array ([isinstance (v, str) for v in values], bool)
+        self.numbers = np.zeros (len (values))
+        self.numbers [~is_str] = [v for v in values if not isinstance (v, str)]
+        self.nstr    = np.zeros (len (values) + 1, dtype = int)
+        np.cumsum (is_str, out = self.nstr [1:])
+    # end def __init__
+
+    def __len__ (self):
+        return len (self.values)
+    # end def __len__
+
+    def offset (self, lineno):
+        """ Offset of first value at or after the given line """
+        if lineno not in self.index:
+            raise KeyError ('Undefined line number %d' % lineno)
+        return self.index [lineno]
+    # end def offset
+
+    def read (self, ptr, n):
+        """ Tuple of n values starting at ptr """
+        if ptr + n > len (self.values):
+            raise IndexError ('Out of DATA')
+        return self.values [ptr:ptr + n]
+    # end def read
+
+    def read_numeric (self, ptr, n):
+        """ Array of n numeric values starting at ptr, None if there
+            is a string among them.
+        """
+        if ptr + n > len (self.values):
+            raise IndexError ('Out of DATA')
+        if self.nstr [ptr + n] != self.nstr [ptr]:
+            return None
+        return self.numbers [ptr:ptr + n]
+    # end def read_numeric
+
+# end class Data_Store
+
 class Exec_Stack:
     """ Stack holding multiline IF/ELSE and FOR/NEXT info
     """
@@ -1190,16 +1690,200 @@ def to_fhandle (x):
     return x
 # end def to_fhandle
 
+class Memory_File (BytesIO):
+    """ File of a Memory_Filesystem, the contents of a writable file
+        are stored in the filesystem when the file is closed.
+    """
+
+    def __init__ (self, fs, name, data = b'', writable = True):
+        super ().__init__ (data)
+        self.fs       = fs
+        self.name     = name
+        self.is_write = writable
+    # end def __init__
+
+    def close (self):
+        if not self.closed:
+            self.store ()
+        super ().close ()
+    # end def close
+
+    def store (self):
+        """ Store current contents in the filesystem """
+        if self.is_write:
+            self.fs.files [self.name] = self.getvalue ()
+    # end def store
+
+    def truncate (self, size = None):
+        self.check_writable ()
+        return super ().truncate (size)
+    # end def truncate
+
+    def check_writable (self):
+        if not self.is_write:
+            raise UnsupportedOperation ('not writable')
+    # end def check_writable
+
+    def writable (self):
+        return self.is_write
+    # end def writable
+
+    def write (self, b):
+        self.check_writable ()
+        return super ().write (b)
+    # end def write
+
+    def writelines (self, lines):
+        self.check_writable ()
+        return super ().writelines (lines)
+    # end def writelines
+
+# end class Memory_File
+
+class OS_Filesystem:
+    """ The real filesystem
+    """
+
+    def open (self, name, mode = 'r'):
+        return open (name, mode)
+    # end def open
+
+    def unlink (self, name):
+        os.unlink (name)
+    # end def unlink
+
+# end class OS_Filesystem
+
+class Memory_Filesystem:
+    """ Files of a BASIC program kept in memory, maps file names to
+        their contents as bytes. Files not found are read from the
+        optional fallback filesystem, files are never written to or
+        removed from the fallback.
+    >>> fs = Memory_Filesystem ()
+    >>> with fs.open ('x.txt', 'w') as f:
+    ...     _ = f.write ('hello\\n')
+    >>> fs.files
+    {'x.txt': b'hello\\n'}
+    >>> with fs.open ('x.txt', 'a') as f:
+    ...     _ = f.write ('world\\n')
+    >>> fs.open ('x.txt', 'r').readlines ()
+    ['hello\\n', 'world\\n']
+    >>> fs.open ('x.txt', 'rb').write (b'x')
+    Traceback (most recent call last):
+    io.UnsupportedOperation: not writable
+    >>> fs.unlink ('x.txt')
+    >>> fs.open ('x.txt', 'rb')
+    Traceback (most recent call last):
+    FileNotFoundError: [Errno 2] No such file or directory: 'x.txt'
+    """
+
+    def __init__ (self, files = None, fallback = None):
+        self.files    = dict (files or {})
+        self.fallback = fallback
+        self.deleted  = set ()
+    # end def __init__
+
+    def lookup (self, name):
+        if name in self.deleted:
+            raise self.not_found (name)
+        if name not in self.files and self.fallback is not None:
+            try:
+                with self.fallback.open (name, 'rb') as f:
+                    self.files [name] = f.read ()
+            except FileNotFoundError:
+                pass
+        if name not in self.files:
+            raise self.not_found (name)
+        return self.files [name]
+    # end def lookup
+
+    def not_found (self, name):
+        return FileNotFoundError \
+            (errno.ENOENT, os.strerror (errno.ENOENT), name)
+    # end def not_found
+
+    def open (self, name, mode = 'r'):
+        """ Open file with the same modes as the builtin open """
+        if mode [0] == 'r':
+            data = self.lookup (name)
+        elif mode [0] == 'a':
+            try:
+                data = self.lookup (name)
+            except FileNotFoundError:
+                data = b''
+        else:
+            data = b''
+        self.files [name] = data
+        self.deleted.discard (name)
+        writable = mode [0] != 'r' or '+' in mode
+        f = Memory_File (self, name, data, writable)
+        if mode [0] == 'a':
+            f.seek (0, 2)
+        if 'b' in mode:
+            return f
+        return TextIOWrapper (f)
+    # end def open
+
+    def unlink (self, name):
+        self.lookup (name)
+        del self.files [name]
+        self.deleted.add (name)
+    # end def unlink
+
+# end class Memory_Filesystem
+
+def make_filesystem (name):
+    """ Filesystem selected with the --filesystem option """
+    if name == 'memory':
+        return Memory_Filesystem (fallback = OS_Filesystem ())
+    return OS_Filesystem ()
+# end def make_filesystem
+
 class Basic_File:
+    """ A file opened by a BASIC program. Random access files (opened
+        with a record length) are memory-mapped if possible, records
+        are transferred between the map and a record buffer with
+        slice copies. Files that cannot be mapped (e.g. devices or
+        empty files opened read-only) use normal file I/O.
+        Sequential files are read in blocks into a read buffer, lines
+        and the fields of INPUT # are taken from the buffer.
+    """
 
-    def __init__ (self, name, mode = None, reclen = None, binary = False):
+    # Size of blocks read from sequential files
+    read_size = 65536
+    # Fields of INPUT #: Leading blanks are skipped, numbers also skip
+    # empty lines while a string is empty at an empty line. A field
+    # ends at a comma or newline which is consumed. A number also
+    # ends at a blank, a string in quotes at the closing quote.
+    number_pat = r'[ \n]*([^ ,\n]*) *[,\n]?'
+    string_pat = r' *(?:"([^"\n]*)"?[^,\n]*|([^,\n]*))[,\n]?'
+    # Patterns matching all fields of an INPUT # statement by kinds
+    fields_re  = {}
+
+    def __init__ \
+        (self, name, mode = None, reclen = None, binary = False
+        , bufsize = 65536, fs = None
+        ):
         self.name        = name
         self.reclen      = reclen
         self.binary      = binary
         self.mode        = mode
         self.fields      = None
-        self.cached_line = None
+        # Values of variables last written to the record buffer
+        self.field_values = {}
+        self.rbuf        = ''
+        self.rpos        = 0
         self.binmode     = ''
+        self.mm          = None
+        self.record      = None
+        self.pos         = 0
+        self.size        = 0
+        self.regular     = False
+        self.bufsize     = bufsize
+        self.out         = None
+        if fs is None:
+            fs = OS_Filesystem ()
+        self.fs          = fs
         if self.binary:
             self.binmode = 'b'
         if name == 'SCRN:':
@@ -1207,26 +1891,101 @@ class Basic_File:
         elif name:
             if mode is None:
                 for m in ('r+', 'w'):
-                    self.mode = m + self.binmode
+                    self.mode = self.file_mode (m)
                     try:
-                        self.f = open (name, self.mode)
+                        self.f = fs.open (name, self.mode)
                         break
                     except FileNotFoundError:
                         pass
             else:
-                self.mode = self.mode + self.binmode
-                self.f = open (name, self.mode)
+                self.mode = self.file_mode (self.mode)
+                self.f = fs.open (name, self.mode)
         else:
             self.f = None
+        if self.reclen:
+            self.record = bytearray (b' ' * self.reclen)
+            if self.f is not None and self.f != sys.stdout:
+                try:
+                    st = os.fstat (self.f.fileno ())
+                    self.size    = st.st_size
+                    self.regular = stat.S_ISREG (st.st_mode)
+                except UnsupportedOperation:
+                    # In-memory file, cannot be mapped
+                    self.size    = self.f.seek (0, 2)
+                    self.regular = True
+                    self.f.seek (0)
+                if self.mode [0] == 'a':
+                    self.pos = self.size
+                self.map ()
     # end def __init__
 
+    @property
+    def writable (self):
+        return self.mode [0] != 'r' or '+' in self.mode
+    # end def writable
+
+    def __getstate__ (self):
+        """ Files are saved by name and position in a checkpoint, the
+            contents of in-memory files are stored in their filesystem
+            which is saved with the interpreter.
+        """
+        self.flush ()
+        state = dict (self.__dict__)
+        del state ['f'], state ['mm'], state ['out']
+        state ['tell'] = None
+        if self.mm is not None:
+            self.mm.flush ()
+        if self.f and self.f != sys.stdout:
+            self.f.flush ()
+            raw = getattr (self.f, 'buffer', self.f)
+            if isinstance (raw, Memory_File):
+                raw.store ()
+            state ['tell'] = self.f.tell ()
+        return state
+    # end def __getstate__
+
+    def __setstate__ (self, state):
+        """ Re-open the file at the saved position, files opened for
+            output must not be truncated again.
+        """
+        tell = state.pop ('tell')
+        self.__dict__.update (state)
+        self.f   = None
+        self.mm  = None
+        self.out = None
+        if self.name == 'SCRN:':
+            self.f = sys.stdout
+        elif self.name:
+            mode = self.mode
+            if mode [0] == 'w':
+                mode = 'r+' + mode.replace ('+', '') [1:]
+            self.f = self.fs.open (self.name, mode)
+            if tell is not None and mode [0] != 'a':
+                self.f.seek (tell)
+                # Drop output written after the checkpoint
+                if self.mode [0] == 'w' and not self.reclen:
+                    self.f.truncate ()
+            if self.reclen:
+                self.map ()
+    # end def __setstate__
+
     def close (self):
+        self.flush ()
+        if self.mm is not None:
+            self.mm.close ()
+            self.mm = None
         if self.f and self.f != sys.stdout:
             self.f.close ()
     # end def close
 
     def eof (self):
+        """ For regular files the end of file is computed from the
+            cached size and position. For text files the end is reached
+            when the read buffer is exhausted and cannot be filled.
+        """
         if self.binary:
+            if self.regular:
+                return self.pos >= self.size
             pos  = self.f.tell ()
             npos = self.f.seek (1, 1)
             if npos == pos:
@@ -1237,22 +1996,287 @@ class Basic_File:
                 assert npos == pos
                 return False
         else:
-            self.cached_line = self.f.readline ()
-            if not self.cached_line:
-                return True
-            return False
+            return self.rpos >= len (self.rbuf) and not self.fill ()
     # end def eof
 
+    def file_mode (self, mode):
+        """ Random access files need read access for mapping them
+            writable, the file is still truncated when opened for
+            output.
+        """
+        if self.reclen and mode == 'w':
+            mode = 'w+'
+        return mode + self.binmode
+    # end def file_mode
+
+    def fill (self):
+        """ Read the next block of a sequential file into the read
+            buffer, False at end of file. Files opened for reading and
+            writing are read by lines: Reading ahead would move the
+            position where PRINT # writes.
+        """
+        self.flush ()
+        if self.writable:
+            # Pending output of the text file must be written first
+            self.f.flush ()
+            data = self.f.readline ()
+        else:
+            data = self.f.read (self.read_size)
+        if not data:
+            return False
+        self.rbuf = self.rbuf [self.rpos:] + data
+        self.rpos = 0
+        return True
+    # end def fill
+
+    def flush (self):
+        if self.out is not None:
+            self.out.flush ()
+    # end def flush
+
+    def map (self):
+        """ Memory-map a regular file, mapping needs a non-empty
+            file, a file opened for writing is mapped when the first
+            record is written.
+        """
+        if not self.regular or not self.size or self.mode [0] == 'a':
+            return
+        try:
+            fileno = self.f.fileno ()
+        except UnsupportedOperation:
+            return
+        access = mmap.ACCESS_READ
+        if self.writable:
+            access = mmap.ACCESS_WRITE
+        self.mm = mmap.mmap (fileno, 0, access = access)
+    # end def map
+
+    def read_record (self):
+        """ Read the next record into the record buffer, return the
+            number of bytes read which may be short at end of file.
+        """
+        if self.mm is not None:
+            end = min (self.pos + self.reclen, len (self.mm))
+            n   = max (end - self.pos, 0)
+            self.record [:n] = self.mm [self.pos:end]
+        else:
+            try:
+                r = self.f.read (self.reclen)
+            except IOError:
+                r = b''
+            n = len (r)
+            self.record [:n] = r
+        self.pos += n
+        return n
+    # end def read_record
+
+    def read_fields (self, strings):
+        """ Fields of INPUT #, strings is a tuple of flags telling
+            if the corresponding field is a string or a number. All
+            fields are matched by one regex, strings have two groups:
+            The quoted and the unquoted form.
+        """
+        # Fast path: The rest of the line holds exactly the fields
+        # and no quotes, a line ending in a blank field is not taken
+        # since a number would skip the newline.
+        end = self.rbuf.find ('\n', self.rpos)
+        if end >= 0:
+            line = self.rbuf [self.rpos:end]
+            if '"' not in line:
+                fields = line.split (',')
+                if len (fields) == len (strings) and fields [-1].strip (' '):
+                    try:
+                        if True in strings:
+                            result = \
+                                [ f.lstrip (' ') if st else float (f)
+                                  for f, st in zip (fields, strings)
+                                ]
+                        else:
+                            result = list (map (float, fields))
+                        self.rpos = end + 1
+                        return result
+                    except ValueError:
+                        pass
+        pattern = self.fields_re.get (strings)
+        if pattern is None:
+            pattern = re.compile \
+                (''.join
+                    (self.string_pat if st else self.number_pat
+                     for st in strings
+                    )
+                )
+            self.fields_re [strings] = pattern
+        m = pattern.match (self.rbuf, self.rpos)
+        while True:
+            groups = m.groups ()
+            end    = len (self.rbuf)
+            if m.end () < end:
+                break
+            # Start of the last field, a quoted string starts at the
+            # quote
+            last = len (groups)
+            if groups [-1] is None:
+                start = m.start (last - 1) - 1
+            else:
+                start = m.start (last)
+            # A match up to the end of the buffer may continue in the
+            # next block unless the last field ended at a newline
+            if start < end and self.rbuf.endswith ('\n'):
+                break
+            if not self.fill ():
+                # At end of file the last field must not start at the end
+                if start >= end:
+                    raise IndexError ('Input past end')
+                break
+            m = pattern.match (self.rbuf, self.rpos)
+        self.rpos = m.end ()
+        result = []
+        idx    = 0
+        for st in strings:
+            v = groups [idx]
+            if st:
+                result.append (groups [idx + 1] if v is None else v)
+                idx += 2
+                continue
+            idx += 1
+            try:
+                result.append (float (v) if v else 0.0)
+            except ValueError:
+                # Double precision exponent
+                result.append (float (v.upper ().replace ('D', 'E')))
+        return result
+    # end def read_fields
+
     def readline (self):
-        if self.cached_line:
-            r = self.cached_line
-            self.cached_line = None
-            return r
-        return self.f.readline ()
+        if self.binary:
+            return self.f.readline ()
+        while True:
+            end = self.rbuf.find ('\n', self.rpos)
+            if end >= 0:
+                line = self.rbuf [self.rpos:end + 1]
+                self.rpos = end + 1
+                return line
+            if not self.fill ():
+                line = self.rbuf [self.rpos:]
+                self.rpos = len (self.rbuf)
+                return line
     # end def readline
 
+    def write (self, s):
+        """ Buffered sequential output, the output continues after
+            the input read so far, the rest of its line is dropped.
+        """
+        if self.rbuf:
+            self.rbuf = ''
+            self.rpos = 0
+            # The text file has read ahead, too
+            self.f.seek (self.f.tell ())
+        if self.out is None:
+            self.out = Output_Buffer (self.f, self.bufsize)
+        self.out.write (s)
+    # end def write
+
+    def write_record (self, recno = None):
+        """ Write the record buffer at the current position or at the
+            given record number (starting at 1).
+        """
+        if recno:
+            self.pos = (recno - 1) * self.reclen
+        end = self.pos + self.reclen
+        if self.mm is None and self.regular and self.writable:
+            if self.mode [0] != 'a':
+                self.f.truncate (max (end, self.size))
+                self.size = max (end, self.size)
+                self.map ()
+        if self.mm is not None and self.writable:
+            if end > len (self.mm):
+                self.mm.resize (end)
+                self.size = end
+            self.mm [self.pos:end] = self.record
+        else:
+            if recno:
+                self.f.seek (self.pos)
+            self.f.write (self.record)
+            self.size = max (end, self.size)
+        self.pos = end
+    # end def write_record
+
 # end class Basic_File
 
+class Snapshot_Pickler (pickle.Pickler):
+    """ The run-time state refers to parts of the compiled program
+        (command lists, closures), these are saved as their path in
+        the program and looked up when the checkpoint is loaded.
+    """
+
+    def __init__ (self, f, paths):
+        super ().__init__ (f)
+        self.paths = paths
+    # end def __init__
+
+    def persistent_id (self, obj):
+        return self.paths.get (id (obj))
+    # end def persistent_id
+
+# end class Snapshot_Pickler
+
+class Snapshot_Unpickler (pickle.Unpickler):
+    """ Only the classes the run-time state consists of may be loaded
+        from a checkpoint, a checkpoint must not be able to call
+        arbitrary functions.
+    """
+
+    own_classes = set \
+        (( 'Basic_File', 'Context', 'Exec_Stack', 'Key_Input'
+         , 'Memory_Filesystem', 'OS_Filesystem', 'Stack_Entry_For'
+         , 'Stack_Entry_If', 'Stack_Entry_While'
+        ))
+    safe_globals = set \
+        (( ('builtins', 'bytearray')
+         , ('builtins', 'complex')
+         , ('builtins', 'frozenset')
+         , ('builtins', 'set')
+         , ('collections', 'deque')
+         , ('numpy', 'dtype')
+         , ('numpy', 'memmap')
+         , ('numpy', 'ndarray')
+         , ('numpy._core._internal', '_convert_to_stringdtype_kwargs')
+         , ('numpy._core.multiarray', '_reconstruct')
+         , ('numpy._core.multiarray', 'scalar')
+         , ('numpy.core.multiarray', '_reconstruct')
+         , ('numpy.core.multiarray', 'scalar')
+        ))
+
+    def __init__ (self, f, interpreter):
+        super ().__init__ (f)
+        self.interpreter = interpreter
+    # end def __init__
+
+    def persistent_load (self, pid):
+        if pid [0] == 'interpreter':
+            return self.interpreter
+        if pid [0] == 'screen':
+            return self.interpreter.screen
+        obj = self.interpreter.lines [pid [1]]
+        for idx in pid [2:]:
+            obj = obj [idx]
+        return obj
+    # end def persistent_load
+
+    def find_class (self, module, name):
+        # Classes of this module are pickled as __main__ when running
+        # as python -m yabasi.bas, make them the same in both cases
+        if module in ('__main__', __spec__.name):
+            if name in self.own_classes:
+                return globals () [name]
+        elif (module, name) in self.safe_globals:
+            return super ().find_class (module, name)
+        raise pickle.UnpicklingError \
+            ('Checkpoint refers to unexpected global %s.%s' % (module, name))
+    # end def find_class
+
+# end class Snapshot_Unpickler
+
 class Interpreter_Test:
     """ This is used for testing: redirecting output, optionally
         redirecting input and passing the program as an iterable.
@@ -1290,79 +2314,97 @@ class Interpreter:
         ((c [0], c [1]) for c in print_special.values ())
     tabpos = [14, 28, 42, 56]
 
-    debug = False
+    debug      = False
+    async_mode = False
+    # Number of lines between checks of the time limit
+    check_interval = 1000
 
     skip_mode_commands = set \
         (('if_start', 'else', 'endif', 'for', 'next', 'while', 'wend'))
 
-    def __init__ (self, args, test = None):
+    # Run-time state saved in a checkpoint
+    snapshot_attrs = \
+        ( 'col', 'stack', 'gstack', 'context', 'files', 'defint'
+        , 'err_seen', 'var', 'dim', 'onerr', 'resume', 'resume_on'
+        , 'data_ptr', 'functions', 'fs', 'kinput', 'next', 'lineno'
+        , 'sublineno', 'cur_line', 'statements', 'field_vars'
+        )
+    no_line = (-1, -1)
+
+    def __init__ (self, args, test = None, program = None):
+        """ The program is compiled once, it can be run several times
+            with a new run-time state set up by reset. The program
+            source is taken from the test, the given program (an
+            iterable of lines) or the file in args.program.
+        """
         self.args   = args
         self.test   = test
-        self.kinput = None
         self.tab    = args.tab
+        # Limits, can be changed before each run
+        self.max_statements = args.max_statements
+        self.timeout        = args.timeout
+        # Checkpoints are written to checkpoint_file on request (by
+        # a signal), every checkpoint_every lines or when the line
+        # halt_line is reached.
+        self.checkpoint_file    = args.checkpoint
+        self.checkpoint_every   = args.checkpoint_statements
+        self.checkpoint_request = None
+        self.halt_line          = self.no_line
+        if args.checkpoint and args.checkpoint_line is not None:
+            self.halt_line = (args.checkpoint_line, 0)
+        self.restored           = False
+        # Numeric arrays of at least memmap_threshold bytes are backed
+        # by scratch files in memmap_dir
+        self.memmap_threshold   = args.memmap_threshold
+        self.memmap_dir         = args.memmap_dir
         if not self.tab:
             self.tab = self.tabpos
         if test is not None and test.input is not None:
-            self.kinput = test.input.read ()
-        else:
-            if args.input_file:
-                with open (args.input_file, 'r') as f:
-                    self.kinput = f.read ()
-            if args.keystring:
-                ks = bytes (args.keystring, 'utf-8')
-                ks = ks.decode ('unicode_escape')
-                if self.kinput:
-                    self.kinput = self.kinput + ks
-                else:
-                    self.kinput = ks
-
+            kinput = Key_Input (test.input)
+        else:
+            kinput = self.read_kinput (args.input_file, args.keystring)
 
-        self.col       = 0
         self.lines     = {}
-        self.stack     = Exec_Stack ()
-        self.gstack    = [] # gosub
-        self.context   = None
-        self.files     = {}
-        self.data      = []
-        self.defint    = {}
-        self.err_seen  = False
-        # Variables and dimensioned variables do not occupy the same namespace
-        self.var       = {}
-        self.dim       = {}
+        # DATA values by line, see Data_Store
+        self.line_data = {}
+        self.data      = None
         self.flines    = {}
-        self.onerr     = None
-        self.resume    = None
-        self.resume_on = None
-        self.var ['DATE$'] = str (datetime.date.today ())
-        self.var ['TIME$'] = datetime.datetime.now ().strftime ('%H:%M:%S')
+
+        ofile = self.own_ofile = None
+        if test is not None:
+            ofile = test.output
+        elif args.output_file:
+            ofile = self.own_ofile = open (args.output_file, 'w')
+        self.screen = None
+        self.reset (kinput, ofile, make_filesystem (args.filesystem))
 
         self.tokenizer = tokenizer.Tokenizer ()
         self.tokens    = tokenizer.Tokenizer.tokens
+        # Parameters of the DEF FN being parsed
+        self.fn_params = {}
         self.parser    = yacc.yacc (module = self, debug = True)
-        self.data_ptr  = 0
-        self.functions = {}
         self.log       = None
         # Only for debugging
         if self.debug:
             self.log = setup_log ()
-        self.ofile = None
-        if test is not None:
-            self.ofile = test.output
-        elif args.output_file:
-            self.ofile = open (args.output_file, 'w')
-        if self.args.screen == 'tkinter':
-            self.screen = Screen_Tkinter (self, self.kinput, self.ofile)
-        else:
-            self.screen = Screen (self, self.kinput, self.ofile)
 
         if test is not None:
             self.compile (test.program)
+        elif program is not None:
+            self.compile (program)
         else:
             with open (args.program, 'r') as f:
                 self.compile (f)
         self.break_lineno = None
     # end def __init__
 
+    def __reduce__ (self):
+        """ The compiled program consists of closures and cannot be
+            pickled, it is reconstructed from the source.
+        """
+        return (self.__class__, (self.args, None, self.source))
+    # end def __reduce__
+
     def __getattr__ (self, name):
         if name.startswith ('cmd_') or name.startswith ('fun_'):
             return getattr (self.screen, name)
@@ -1381,10 +2423,24 @@ class Interpreter:
         return self.flines [(self.lineno, self.sublineno)]
     # end def fline
 
+    def close_files (self):
+        for f in self.files.values ():
+            f.close ()
+        self.files      = {}
+        self.field_vars = {}
+    # end def close_files
+
     def close_output (self):
-        if self.ofile and not self.test:
-            self.ofile.close ()
-            self.ofile = None
+        """ Flush buffered output of screen and files at the end of
+            the program, files stay open. Only an output file opened
+            by the interpreter is closed.
+        """
+        self.screen.flush ()
+        for f in self.files.values ():
+            f.flush ()
+        if self.own_ofile:
+            self.own_ofile.close ()
+            self.own_ofile = self.ofile = None
     # end def close_output
 
     def compile_lines (self, f):
@@ -1400,6 +2456,8 @@ class Interpreter:
                 self.sublineno = sublineno
                 r = l.lstrip ()
             self.flines [(lineno, sublineno)] = fline + 1
+            # DATA of a line replaced by a patch
+            self.line_data.pop ((lineno, sublineno), None)
             self.tokenizer.lexer.lineno    = lineno
             self.tokenizer.lexer.sublineno = sublineno
             self.tokenizer.lexer.fline     = fline + 1
@@ -1420,12 +2478,14 @@ class Interpreter:
                     self.insert (p)
                     continue
             self.tokenizer.feed (r)
+            self.fn_params = {}
             r = self.parser.parse (lexer = self.tokenizer, debug = self.log)
             self.insert (r)
     # end def compile_lines
 
     def compile (self, f):
-        self.compile_lines (f)
+        self.source = list (f)
+        self.compile_lines (self.source)
         self.compile_lines (self.args.patch)
         self.nextline = {}
         self.first    = None
@@ -1436,24 +2496,45 @@ class Interpreter:
             if prev is not None:
                 self.nextline [prev] = l
             prev = l
+        self.data = Data_Store (self.line_data, self.lines)
     # end def compile
 
     def exec_cmdlist (self, cmdlist, idx):
-        for i in range (idx, len (cmdlist)):
-            cmd = cmdlist [i]
-            self.context = Context (self, cmdlist, i)
-            if not self.running:
-                return
-            cmd [0] (*cmd [1:])
-            if self.test and self.test.hook:
-                self.test.hook (self)
-            # Handle cmdlist continue at top level to avoid stack growth
-            if self.stack and self.stack.top.need_continue:
-                return
-            # If there was a GOSUB stop execution of cmdlist
-            if self.context is None:
+        """ Execute the command list starting at index idx. Commands
+            continuing in another command list (multiple commands, IF
+            with several commands, RETURN into the middle of a line)
+            don't call us recursively but set self.jump, execution
+            continues there. So the Python stack does not grow with
+            nested BASIC control flow.
+        """
+        self.jump = None
+        while True:
+            for i in range (idx, len (cmdlist)):
+                cmd = cmdlist [i]
+                self.context = Context (self, cmdlist, i)
+                if not self.running:
+                    return
+                try:
+                    cmd [0] (*cmd [1:])
+                except Input_Pending:
+                    # Continue the command list after input
+                    self.resume_ctx = self.context
+                    raise
+                if self.test and self.test.hook:
+                    self.test.hook (self)
+                if self.jump is not None:
+                    break
+                # Handle cmdlist continue at top level
+                if self.stack and self.stack.top.need_continue:
+                    return
+                # If there was a GOSUB stop execution of cmdlist
+                if self.context is None:
+                    return
+            else:
+                self.context = None
                 return
-        self.context = None
+            cmdlist, idx = self.jump
+            self.jump = None
     # end def exec_cmdlist
 
     def fixtype_mbf (self, a, b, op):
@@ -1483,14 +2564,193 @@ class Interpreter:
         return op (a, b)
     # end def fixtype_single
 
+    def fuse_read_loops (self, cmdlist):
+        """ Replace FOR I = x TO y: READ A(I): NEXT I in cmdlist with
+            a single command reading the data into the array in one
+            operation, see cmd_read_array. The bounds x and y must be
+            literals or variables: They are evaluated again by the FOR
+            when the loop is run unchanged.
+        """
+        def simple (expr):
+            return getattr (expr, 'var', None) or hasattr (expr, 'literal')
+        result = list (cmdlist)
+        for i in reversed (range (len (cmdlist) - 2)):
+            c_for, c_read, c_next = cmdlist [i:i + 3]
+            if  (  c_for  [0] != self.cmd_for  or len (c_for) != 4
+                or c_read [0] != self.cmd_read or len (c_read [1]) != 1
+                or c_next [0] != self.cmd_next or c_next [1] != c_for [1]
+                ):
+                continue
+            lhs   = c_read [1][0]
+            index = getattr (lhs, 'index', ())
+            var, frm, to = c_for [1:]
+            if  (   len (index) == 1
+                and getattr (index [0], 'var', None) == var
+                and simple (frm) and simple (to)
+                ):
+                result [i:i + 3] = \
+                    [(self.cmd_read_array, var, frm, to, lhs.array, cmdlist, i)]
+        return result
+    # end def fuse_read_loops
+
     def insert (self, r):
         k = (self.lineno, self.sublineno)
         if isinstance (r, list):
-            self.lines [k] = (self.cmd_multi, r)
+            self.lines [k] = (self.cmd_multi, self.fuse_read_loops (r))
         else:
             self.lines [k] = r
     # end def insert
 
+    def read_kinput (self, input_file = None, keystring = None):
+        """ Keyboard input from input file followed by keystring, the
+            input file is read while the program runs.
+        """
+        sources = []
+        if input_file:
+            sources.append (open (input_file, 'r'))
+        if keystring:
+            ks = bytes (keystring, 'utf-8')
+            ks = ks.decode ('unicode_escape')
+            sources.append (StringIO (ks))
+        if not sources:
+            return None
+        return Key_Input (*sources)
+    # end def read_kinput
+
+    def close_input (self, keep = None):
+        """ Close keyboard input (e.g. the input file) of the run
+            except for keep which is re-used for the next run.
+        """
+        kinputs = [getattr (self, 'kinput', None)]
+        if getattr (self, 'screen', None) is not None:
+            kinputs.append (self.screen.kinput)
+        for kinput in kinputs:
+            if isinstance (kinput, Key_Input) and kinput is not keep:
+                kinput.close ()
+    # end def close_input
+
+    def reset (self, kinput = None, ofile = None, fs = None):
+        """ Initialize the run-time state, this allows a compiled
+            program to be run several times, each time with new
+            keyboard input, output file and filesystem (default is
+            the real filesystem). Files left open by a previous run
+            are closed, as is its keyboard input.
+        """
+        if getattr (self, 'files', None):
+            self.close_files ()
+        self.close_input (keep = kinput)
+        if fs is None:
+            fs = OS_Filesystem ()
+        self.fs        = fs
+        self.kinput    = kinput
+        self.ofile     = ofile
+        self.col       = 0
+        self.stack     = Exec_Stack ()
+        self.gstack    = [] # gosub
+        self.context   = None
+        self.jump      = None
+        self.files     = {}
+        self.defint    = {}
+        self.err_seen  = False
+        # Variables and dimensioned variables do not occupy the same namespace
+        self.var       = {}
+        self.dim       = {}
+        # Variables bound to fields of record buffers by FIELD
+        self.field_vars = {}
+        self.onerr     = None
+        self.resume    = None
+        self.resume_on = None
+        self.var ['DATE$'] = str (datetime.date.today ())
+        self.var ['TIME$'] = datetime.datetime.now ().strftime ('%H:%M:%S')
+        self.data_ptr  = 0
+        self.functions = {}
+        if self.screen is None:
+            if self.args.screen == 'tkinter':
+                self.screen = Screen_Tkinter (self, kinput, ofile)
+            else:
+                self.screen = Screen (self, kinput, ofile)
+        else:
+            self.screen.set_io (kinput, ofile)
+    # end def reset
+
+    def checkpoint (self, filename):
+        """ Save the run-time state to filename, the program must be
+            stopped between two lines (as after step). The source is
+            saved, too, a checkpoint can only be restored for the same
+            program.
+        """
+        paths = self.compiled_objects ()
+        state = dict ((k, getattr (self, k)) for k in self.snapshot_attrs)
+        state ['screen'] = self.screen.get_state ()
+        tmp = filename + '.tmp'
+        with open (tmp, 'wb') as f:
+            pickle.dump (self.source, f)
+            Snapshot_Pickler (f, paths).dump (state)
+        os.replace (tmp, filename)
+    # end def checkpoint
+
+    def compiled_objects (self):
+        """ Map ids of the objects of the compiled program (command
+            tuples and lists, closures) to their path in the program.
+        """
+        paths = {id (self): ('interpreter',), id (self.screen): ('screen',)}
+        def walk (obj, path):
+            if id (obj) in paths:
+                return
+            if isinstance (obj, (tuple, list)):
+                paths [id (obj)] = path
+                for idx, item in enumerate (obj):
+                    walk (item, path + (idx,))
+            elif callable (obj):
+                paths [id (obj)] = path
+        for k, line in self.lines.items ():
+            walk (line, ('line', k))
+        return paths
+    # end def compiled_objects
+
+    def restore (self, filename):
+        """ Restore the run-time state from a checkpoint, the next
+            run continues where the checkpoint was written. Output
+            goes to the current output file.
+        """
+        with open (filename, 'rb') as f:
+            if Snapshot_Unpickler (f, self).load () != self.source:
+                raise ValueError \
+                    ('Checkpoint %s is for a different program' % filename)
+            state = Snapshot_Unpickler (f, self).load ()
+        if getattr (self, 'files', None):
+            self.close_files ()
+        self.screen.set_state (state.pop ('screen'))
+        for k in self.snapshot_attrs:
+            setattr (self, k, state [k])
+        # Arrays are saved with their contents, large arrays get a new
+        # scratch file
+        for name, a in self.dim.items ():
+            m = self.scratch_array (a.shape, a.dtype)
+            if m is not None:
+                m [...] = a
+                self.dim [name] = m
+        self.restored = True
+    # end def restore
+
+    def scratch_array (self, shape, dtype):
+        """ A zero-initialized numeric array of at least
+            memmap_threshold bytes is mapped from an unnamed scratch
+            file, the file is removed by the OS when the array is
+            no longer used. Returns None for other arrays.
+        """
+        dtype = np.dtype (dtype)
+        if  (   self.memmap_threshold is None
+            or  dtype.kind not in 'iuf'
+            or  prod (shape) * dtype.itemsize < self.memmap_threshold
+            ):
+            return None
+        scratch = tempfile.TemporaryFile (dir = self.memmap_dir)
+        with scratch:
+            return np.memmap \
+                (scratch, dtype = dtype, mode = 'w+', shape = tuple (shape))
+    # end def scratch_array
+
     def is_single (self, e):
         return self.args.single_precision and (e not in '#%$' or e == '!')
     # end def is_single
@@ -1505,6 +2765,33 @@ class Interpreter:
         return (lhs.get (), expr)
     # end def lset_rset_mid_paramcheck
 
+    def bound_field (self, lhs):
+        """ The field (file, offset, length) of the record buffer a
+            variable is bound to by FIELD or None
+        """
+        if isinstance (lhs, L_Value_Var):
+            return self.field_vars.get (lhs.name)
+        return None
+    # end def bound_field
+
+    def set_field (self, field, name, value, start = 0, end = None):
+        """ Set a variable bound to a field, the changed part from
+            start to end of the value is written to the record buffer.
+            The whole field is written if the buffer is not in sync
+            with the variable, e.g. after an assignment.
+        """
+        fobj, off, l = field
+        if end is None or fobj.field_values.get (name) is not self.var [name]:
+            start, end = 0, l
+        s = value [start:end]
+        if isinstance (s, str):
+            s = s.encode ('ascii')
+        if len (s) < end - start:
+            s += b' ' * (end - start - len (s))
+        fobj.record [off + start:off + end] = s
+        self.var [name] = fobj.field_values [name] = value
+    # end def set_field
+
     def on_close (self):
         self.running = False
     # end def on_close
@@ -1526,42 +2813,242 @@ class Interpreter:
     # end def raise_error
 
     def run (self):
+        if self.prepare ():
+            while self.step (self.step_count ()):
+                if self.check_limits () or self.check_checkpoint ():
+                    break
+        self.finish ()
+    # end def run
+
+    async def run_async (self, get_input, count = 1000):
+        """ Run the program as a coroutine: Control is returned to the
+            event loop after every count lines and when the program
+            waits for keyboard input. The input is awaited from
+            get_input, an async function called with the prompt. The
+            statement waiting for input is then executed again.
+        """
+        self.async_mode = True
+        try:
+            running = self.prepare ()
+            while running:
+                n = self.step_count ()
+                if n is None or count < n:
+                    n = count
+                try:
+                    running = \
+                        (   self.step (n)
+                        and not self.check_limits ()
+                        and not self.check_checkpoint ()
+                        )
+                except Input_Pending as pending:
+                    self.screen.flush ()
+                    value = await get_input (pending.prompt)
+                    self.screen.replay = len (self.screen.consumed)
+                    self.screen.kinput = Key_Input.from_lines \
+                        (self.screen.consumed + [value])
+                    continue
+                await asyncio.sleep (0)
+        finally:
+            self.async_mode = False
+        self.finish ()
+    # end def run_async
+
+    def check_limits (self):
+        """ Stop the program if the statement or time limit is reached
+        """
+        if  (   self.max_statements is not None
+            and self.statements >= self.max_statements
+            ):
+            self.status = 'max-statements'
+        elif (   self.timeout is not None
+             and time.monotonic () - self.t_start >= self.timeout
+             ):
+            self.status = 'timeout'
+        else:
+            return False
+        print \
+            ( 'Stopped: %s limit reached in line %s (%s.%s)'
+            % (self.status, self.fline, self.lineno, self.sublineno)
+            , file = sys.stderr
+            )
+        self.running = False
+        return True
+    # end def check_limits
+
+    def check_checkpoint (self):
+        """ Write a checkpoint if requested by a signal, when the
+            statement count is reached or the halt line (only the
+            first time). Returns True if the program should stop.
+        """
+        if not self.checkpoint_file:
+            return False
+        request = self.checkpoint_request
+        if  (   self.checkpoint_every
+            and self.statements >= self.next_checkpoint
+            ):
+            request = request or 'continue'
+            self.next_checkpoint = self.statements + self.checkpoint_every
+        if self.cur_line == self.halt_line:
+            request = request or 'continue'
+            self.halt_line = self.no_line
+        if not request:
+            return False
+        self.checkpoint_request = None
+        self.checkpoint (self.checkpoint_file)
+        if request == 'stop':
+            self.status  = 'checkpoint'
+            self.running = False
+            return True
+        return False
+    # end def check_checkpoint
+
+    def on_checkpoint_signal (self, signum, frame):
+        """ SIGUSR1 writes a checkpoint, SIGTERM writes a checkpoint
+            and stops the program. The checkpoint is written after
+            the current step.
+        """
+        if signum == signal.SIGTERM:
+            self.checkpoint_request = 'stop'
+        else:
+            self.checkpoint_request = self.checkpoint_request or 'continue'
+    # end def on_checkpoint_signal
+
+    def run_status (self):
+        """ Result of the last run: The status is 'ok', 'error', the
+            limit that stopped the program ('max-statements' or
+            'timeout') or 'checkpoint' if stopped after writing a
+            checkpoint, the line reached, the number of executed lines
+            and the run time in seconds.
+        """
+        status = self.status
+        if status is None:
+            status = 'error' if self.err_seen else 'ok'
+        return dict \
+            ( status     = status
+            , line       = self.lineno
+            , fline      = self.fline
+            , statements = self.statements
+            , time       = self.t_end - self.t_start
+            )
+    # end def run_status
+
+    def step_count (self):
+        """ Number of lines to run before checking the limits and
+            checkpoint requests
+        """
+        count = None
+        if self.timeout is not None or self.checkpoint_file:
+            count = self.check_interval
+        for limit in (self.max_statements, self.next_checkpoint):
+            if limit is not None:
+                rest = max (limit - self.statements, 0)
+                if count is None or rest < count:
+                    count = rest
+        return count
+    # end def step_count
+
+    def prepare (self):
+        """ Prepare running the program, False if it cannot run. After
+            restoring a checkpoint the program continues at the saved
+            position.
+        """
+        if not self.restored:
+            self.statements = 0
+            self.cur_line   = self.first
+        self.status     = None
+        self.t_start    = self.t_end = time.monotonic ()
+        self.next_checkpoint = None
+        if self.checkpoint_every:
+            self.next_checkpoint = self.statements + self.checkpoint_every
         if self.err_seen:
-            self.close_output ()
-            return
-        self.running = True
-        l = self.first
-        self.lineno, self.sublineno = l
+            return False
+        self.running    = True
+        self.resume_ctx = None
+        if not self.restored:
+            self.lineno, self.sublineno = self.first
+        self.restored   = False
+        return True
+    # end def prepare
+
+    def step (self, count = None):
+        """ Execute at most count lines (all if None), returns True if
+            the program is not yet finished. Each repetition of a loop
+            within a line counts as a line.
+        """
+        l = self.cur_line
+        resume, self.resume_ctx = self.resume_ctx, None
         # Ignore these exceptions and print better error:
         ex = (ZeroDivisionError, ValueError, KeyError, IndexError)
+        n  = 0
+        # Loop in a line that needs to be continued
+        cont = self.stack and self.stack.top.need_continue
         while self.running and not self.err_seen and l:
-            if  (  (self.sublineno == 0 and self.lineno == self.break_lineno)
-                or self.break_lineno == 'all'
-                ):
-                import pdb; pdb.set_trace ()
-            if self.test and self.test.hook:
-                self.test.hook (self)
-            self.next = self.nextline.get (l)
-            line = self.lines [l]
-            if line is None:
-                self.raise_error ('Uncompiled line')
-                self.close_output ()
-                return
-            name = line [0].__name__.split ('_', 1) [-1]
-            if self.exec_condition or name in self.skip_mode_commands:
-                try:
-                    line [0] (*line [1:])
-                except ex as err:
-                    self.raise_error (repr (err))
-            while self.stack and self.stack.top.need_continue:
-                self.stack.top.exec ()
+            if n == count:
+                self.cur_line    = l
+                self.statements += n
+                return True
+            n += 1
+            try:
+                if cont:
+                    self.stack.top.exec ()
+                else:
+                    if l == self.halt_line and n > 1:
+                        self.cur_line    = l
+                        self.statements += n - 1
+                        return True
+                    if  (  (   self.sublineno == 0
+                           and self.lineno == self.break_lineno
+                           )
+                        or self.break_lineno == 'all'
+                        ):
+                        import pdb; pdb.set_trace ()
+                    if self.test and self.test.hook:
+                        self.test.hook (self)
+                    if resume is None:
+                        self.next = self.nextline.get (l)
+                        line = self.lines [l]
+                    else:
+                        # Continue a line interrupted by INPUT
+                        resume.restore_context ()
+                        line = \
+                            (self.exec_cmdlist, resume.cmdlist, resume.cmdidx)
+                        resume = None
+                    if line is None:
+                        self.raise_error ('Uncompiled line')
+                        break
+                    name = line [0].__name__.split ('_', 1) [-1]
+                    if self.exec_condition or name in self.skip_mode_commands:
+                        try:
+                            line [0] (*line [1:])
+                            if self.jump is not None:
+                                self.exec_cmdlist (*self.jump)
+                        except ex as err:
+                            self.raise_error (repr (err))
+            except Input_Pending:
+                self.cur_line    = l
+                self.statements += n - 1
+                raise
+            if self.screen.pending:
+                self.screen.refresh ()
+            cont = self.stack and self.stack.top.need_continue
+            if cont:
+                continue
             l = self.next
             if l:
                 self.lineno, self.sublineno = l
+        self.statements += n
+        return False
+    # end def step
+
+    def finish (self):
+        """ Finish the run: Update display and flush output """
+        self.t_end = time.monotonic ()
+        self.screen.refresh (force = True)
         self.close_output ()
+        self.close_input ()
         if self.test and self.test.capture and self.screen:
             self.screen.dump_contents (self.test)
-    # end def run
+    # end def finish
 
     # FUNCTIONS which need access to interpreter
 
@@ -1571,22 +3058,10 @@ class Interpreter:
     # end def fun_eof
 
     def fun_fn (self, fname, exprlist):
-        """ Temporarily bind function args to values from exprlist then
-            call the function, then restore args.
-        """
-        varlist, expr = self.functions [fname]
-        oldval = {}
-        for ex, vname in zip (exprlist (), varlist):
-            if vname in self.var:
-                oldval [vname] = self.var [vname]
-            self.var [vname] = ex
-        retval = expr ()
-        for vname in varlist:
-            if vname in oldval:
-                self.var [vname] = oldval [vname]
-            else:
-                del self.var [vname]
-        return retval
+        """ Call function defined with DEF FN with the values of
+            exprlist, see p_def_statement.
+        """
+        return self.functions [fname] (exprlist ())
     # end def fun_fn
 
     def fun_tab (self, expr):
@@ -1617,7 +3092,8 @@ class Interpreter:
         if fhandle is None:
             for fh in self.files:
                 self.files [fh].close ()
-            self.files = {}
+            self.files      = {}
+            self.field_vars = {}
             return
         fhandle = to_fhandle (fhandle)
         if fhandle not in self.files:
@@ -1626,13 +3102,15 @@ class Interpreter:
                 , file = sys.stderr
                 )
             return
-        if self.files [fhandle]:
-            self.files [fhandle].f.close ()
-        del self.files [fhandle]
+        fobj = self.files.pop (fhandle)
+        if fobj:
+            fobj.close ()
+        self.field_vars = \
+            {k: b for k, b in self.field_vars.items () if b [0] is not fobj}
     # end def cmd_close
 
-    def cmd_deffn (self, fname, varlist, expr):
-        self.functions [fname] = (varlist, expr)
+    def cmd_deffn (self, fname, fn):
+        self.functions [fname] = fn
     # end def cmd_deffn
 
     def cmd_defint (self, vars):
@@ -1654,12 +3132,16 @@ class Interpreter:
             v, l = dentry ()
             dtype = float
             if v.endswith ('$'):
-                dtype = object
-            elif v.endswith ('%'):
+                self.dim [v] = np.full (l, '', dtype = string_dtype)
+                continue
+            if v.endswith ('%'):
                 dtype = int
             if self.is_single (v [-1]):
                 dtype = np.single
-            self.dim [v] = np.zeros (l, dtype = dtype)
+            a = self.scratch_array (l, dtype)
+            if a is None:
+                a = np.zeros (l, dtype = dtype)
+            self.dim [v] = a
     # end def cmd_dim
 
     def _ifclause_check (self):
@@ -1698,7 +3180,18 @@ class Interpreter:
         fhandle = to_fhandle (fhandle)
         if fhandle not in self.files:
             self.files [fhandle] = Basic_File (None)
-        self.files [fhandle].fields = fieldlist
+        fobj = self.files [fhandle]
+        fobj.fields = fieldlist
+        fobj.field_values = {}
+        if fobj.record is None:
+            return
+        # Plain variables are bound to their part of the record buffer
+        off = 0
+        for l, lhs in fieldlist:
+            l = max (0, min (l, fobj.reclen - off))
+            if lhs.var is not None:
+                self.field_vars [lhs.var] = (fobj, off, l)
+            off += l
     # end def cmd_field
 
     def cmd_for (self, var, frm, to, step = 1):
@@ -1733,13 +3226,15 @@ class Interpreter:
             for l, lhs in fl:
                 lhs ().set ('')
         else:
-            try:
-                r = f.f.read (f.reclen)
-            except IOError:
-                r = b''
+            n   = f.read_record ()
+            rec = memoryview (f.record)
             off = 0
+            f.field_values = {}
             for l, lhs in fl:
-                lhs ().set (r [off:off+l])
+                v = bytes (rec [off:min (off + l, n)])
+                lhs ().set (v)
+                if self.field_vars.get (lhs.var) == (f, off, len (v)):
+                    f.field_values [lhs.var] = v
                 off += l
     # end def cmd_get
 
@@ -1763,7 +3258,7 @@ class Interpreter:
         elif isinstance (line_or_cmd, tuple):
             line_or_cmd [0] (*line_or_cmd [1:])
         else:
-            self.exec_cmdlist (line_or_cmd, 0)
+            self.jump = (line_or_cmd, 0)
     # end def _cmd_if
 
     def cmd_if (self, expr, line_or_cmd, line_or_cmd2 = None):
@@ -1778,23 +3273,27 @@ class Interpreter:
         self.stack.push (Stack_Entry_If (self, cond))
     # end def cmd_if_start
 
-    def _input (self, fhandle, prompt = ''):
-        if fhandle is None:
-            value = self.screen.cmd_input (prompt)
-        else:
-            value = self.files [fhandle].readline ().rstrip ()
-        return value
-    # end def _input
-
-    def cmd_input (self, vars, s = '', fhandle = None):
+    def cmd_input (self, vars, s = '', fhandle = None, plain = None):
         if fhandle is not None:
-            fhandle = to_fhandle (fhandle)
+            f = self.files [to_fhandle (fhandle)]
+            if plain is not None:
+                for lhs, v in zip (vars, f.read_fields (plain)):
+                    lhs ().set (v)
+            else:
+                # Array indexes may use values read by the same statement
+                for lhs in vars:
+                    lhs = lhs ()
+                    lhs.set (f.read_fields ((lhs.name.endswith ('$'),)) [0])
+            return
         prompt = s + ': '
-        value = self._input (fhandle, prompt)
+        # Input consumed by a statement interrupted by Input_Pending
+        # is given to the statement again
+        self.screen.consumed = []
+        value = self.screen.cmd_input (prompt)
         if len (vars) > 1:
             vals = value.split (',')
             while len (vars) > len (vals):
-                value = self._input (fhandle)
+                value = self.screen.cmd_input ('')
                 vals.extend (value.split (','))
             for lhs, v in zip (vars, vals):
                 lhs ().set (v)
@@ -1816,7 +3315,7 @@ class Interpreter:
         if not isinstance (s, str):
             self.raise_error ("Non-string expression")
         try:
-            os.unlink (s)
+            self.fs.unlink (s)
         except FileNotFoundError:
             pass
     # end def cmd_kill
@@ -1845,6 +3344,9 @@ class Interpreter:
         v, expr = self.lset_rset_mid_paramcheck (lhs, expr ())
         if expr is None:
             return
+        field = self.bound_field (lhs)
+        if field is not None:
+            v = ' ' * field [2]
         if v is None:
             v = ' ' * len (expr)
         if len (expr) < len (v):
@@ -1854,14 +3356,33 @@ class Interpreter:
                 expr += ' ' * (len (v) - len (expr))
         if len (expr) > len (v):
             expr = expr [:len (v)]
-        lhs.set (expr)
+        if field is None:
+            lhs.set (expr)
+        else:
+            self.set_field (field, lhs.name, expr)
     # end def cmd_lset
 
     def cmd_mid (self, lhs, pos, length, expr):
+        """ MID$ statement: Replace characters of a string variable
+            starting at pos (1-based), the length is not changed.
+        """
         lhs = lhs ()
         v, expr = self.lset_rset_mid_paramcheck (lhs, expr ())
         if v is None or expr is None:
             return
+        # Keep the type of the variable, fields read by GET are bytes
+        if isinstance (v, bytes) and isinstance (expr, str):
+            expr = expr.encode ('ascii')
+        elif isinstance (v, str) and isinstance (expr, bytes):
+            expr = expr.decode ('ascii')
+        pos = int (pos ()) - 1
+        if pos < 0:
+            self.raise_error ('Illegal function call')
+            return
+        if length is None:
+            length = len (expr)
+        else:
+            length = int (length ())
         if pos + length > len (v):
             length = len (v) - pos
         if length <= 0:
@@ -1870,12 +3391,17 @@ class Interpreter:
             expr = expr [:length]
         if len (expr) < length:
             length = len (expr)
-        lhs.set (v [:pos] + expr + v [pos + length:])
-    # end def cmd_lset
+        v = v [:pos] + expr + v [pos + length:]
+        field = self.bound_field (lhs)
+        if field is None:
+            lhs.set (v)
+        else:
+            self.set_field (field, lhs.name, v, pos, pos + length)
+    # end def cmd_mid
 
     def cmd_multi (self, l):
         """ Multiple commands separated by colon """
-        self.exec_cmdlist (l, 0)
+        self.jump = (l, 0)
     # end def cmd_multi
 
     def cmd_next (self, var):
@@ -1940,34 +3466,45 @@ class Interpreter:
         elif forwhat == 'input':
             mode = 'r'
         is_bin = len_expr is not None
+        bs = self.args.output_buffer_size
         try:
-            self.files [fhandle] = Basic_File (expr, mode, len_expr, is_bin)
+            self.files [fhandle] = Basic_File \
+                (expr, mode, len_expr, is_bin, bufsize = bs, fs = self.fs)
         except IOError as err:
             self.raise_error (err)
     # end def cmd_open
 
     def cmd_print (self, printlist, fhandle = None, using = False):
-        file = None
-        fn   = None
         fobj = None
         if fhandle is not None:
             fobj = self.files [fhandle]
-            file = fobj.f
-            fn   = fobj.name
+        items = printlist ()
+        # Fast path for the common case of printing a single item
+        if len (items) == 1 and not using:
+            v = items [0]
+            if callable (v):
+                v = v ()
+            if v not in self.special_by_code:
+                if isinstance (v, (float, np.single)):
+                    v = format_float (v)
+                self.col = 0
+                self._print_out (fobj, str (v), '\n')
+                return
         l   = []
         c   = None
         fmt = None
-        for n, v in enumerate (printlist ()):
+        for n, v in enumerate (items):
             if callable (v):
                 v = v ()
             if n == 0 and using:
-                fmt = Print_Using (v)
+                fmt  = print_using (v)
+                fidx = 0
                 continue
             c = self.special_by_code.get (v, None)
             if c is None:
                 if fmt:
-                    f = fmt.get ()
-                    v = f % v
+                    v = fmt.get (fidx) % v
+                    fidx += 1
                 elif isinstance (v, (float, np.single)):
                     v = format_float (v)
                 v = str (v)
@@ -1986,46 +3523,84 @@ class Interpreter:
             self.col = 0
         else:
             end = ''
-        if file is None or fn == 'SCRN:':
-            self.screen.cmd_print (''.join (l), end = end)
-        else:
-            print (''.join (l), file = file, end = end)
+        self._print_out (fobj, ''.join (l), end)
     # end def cmd_print
 
+    def _print_out (self, fobj, s, end):
+        if fobj is None or fobj.name == 'SCRN:':
+            self.screen.cmd_print (s, end = end)
+        else:
+            fobj.write (s + end)
+    # end def _print_out
+
     def cmd_put (self, fhandle, recno = None):
         fh = to_fhandle (fhandle)
         if recno is not None:
             recno = int (recno)
         if self.files [fh] is not None:
             fobj = self.files [fh]
-            fl   = fobj.fields
-            buf = []
-            for l, lhs in fl:
+            rec  = fobj.record
+            off  = 0
+            for l, lhs in fobj.fields:
+                if off >= fobj.reclen:
+                    break
+                # Fields set with LSET/RSET/MID$ are already in the buffer
+                name = lhs.var
+                if  (   name in fobj.field_values
+                    and fobj.field_values [name] is self.var.get (name)
+                    ):
+                    off += min (l, fobj.reclen - off)
+                    continue
                 s = lhs ().get ()
                 if s is None:
                     s = b''
                 if isinstance (s, str):
                     s = s.encode ('ascii')
+                l = min (l, fobj.reclen - off)
                 if len (s) < l:
                     s += b' ' * (l - len (s))
-                if len (s) > l:
-                    s = s [:l]
-                buf.append (s)
-            buf = b''.join (buf)
-            if len (buf) > fobj.reclen:
-                buf = buf [:fobj.reclen]
-            if len (buf) < fobj.reclen:
-                buf += b' ' * (fobj.reclen - len (buf))
-            if recno:
-                fobj.f.seek ((recno - 1) * fobj.reclen)
-            fobj.f.write (buf)
+                rec [off:off + l] = s [:l]
+                off += l
+            rec [off:] = b' ' * (fobj.reclen - off)
+            fobj.write_record (recno)
     # end def cmd_put
 
+    def cmd_read_array (self, var, frm, to, name, cmdlist, idx):
+        """ FOR var = frm TO to: READ name(var): NEXT var for a
+            numeric array: The values are copied from the data store
+            in one operation, numpy converts them to the type of the
+            array. Other cases (e.g. strings, an index out of range)
+            continue with the original commands at cmdlist [idx].
+        """
+        a = self.dim.get (name)
+        if  (   a is not None and a.ndim == 1 and a.dtype.kind in 'iuf'
+            and not any
+                ( isinstance (e, Stack_Entry_For) and e.var == var
+                  for e in self.stack
+                )
+            ):
+            f = frm ()
+            t = to ()
+            n = floor (t - f) + 1
+            if f == int (f) and n > 0 and 0 <= f and f + n <= len (a):
+                try:
+                    values = self.data.read_numeric (self.data_ptr, n)
+                except IndexError:
+                    values = None
+                if values is not None:
+                    a [int (f):int (f) + n] = values
+                    self.data_ptr += n
+                    self.var [var] = f + n
+                    return
+        self.jump = (cmdlist, idx)
+    # end def cmd_read_array
+
     def cmd_read (self, vars):
-        for lhs in vars:
-            result = self.data [self.data_ptr]
-            self.data_ptr += 1
-            lhs ().set (result)
+        values = self.data.read (self.data_ptr, len (vars))
+        self.data_ptr += len (vars)
+        # Variables are evaluated in turn, they may use values read
+        for lhs, value in zip (vars, values):
+            lhs ().set (value)
     # end def cmd_read
 
     def cmd_rem (self):
@@ -2037,9 +3612,13 @@ class Interpreter:
     # end def cmd_reset
 
     def cmd_restore (self, lineno = None):
-        if lineno is not None:
-            raise NotImplementedError ('RESTORE with line number unsupported')
-        self.data_ptr = 0
+        if lineno is None:
+            self.data_ptr = 0
+        else:
+            try:
+                self.data_ptr = self.data.offset (lineno)
+            except KeyError:
+                self.raise_error ('Undefined line number %s' % lineno)
     # end def cmd_restore
 
     def cmd_resume (self, nextline):
@@ -2065,7 +3644,9 @@ class Interpreter:
         if lineno is None:
             next.restore_context ()
             if next.cmdlist:
-                self.exec_cmdlist (next.cmdlist, next.cmdidx + 1)
+                self.jump = (next.cmdlist, next.cmdidx + 1)
+            else:
+                self.context = None
         else:
             self.lineno    = lineno
             self.sublineno = 0
@@ -2084,6 +3665,9 @@ class Interpreter:
         v, expr = self.lset_rset_mid_paramcheck (lhs, expr ())
         if expr is None:
             return
+        field = self.bound_field (lhs)
+        if field is not None:
+            v = ' ' * field [2]
         if v is None:
             v = ' ' * len (expr)
         if len (expr) < len (v):
@@ -2093,7 +3677,10 @@ class Interpreter:
                 expr = ' ' * (len (v) - len (expr)) + expr
         if len (expr) > len (v):
             expr = expr [:len (v)]
-        lhs.set (expr)
+        if field is None:
+            lhs.set (expr)
+        else:
+            self.set_field (field, lhs.name, expr)
     # end def cmd_rset
 
     def cmd_shell (self, expr):
@@ -2121,13 +3708,15 @@ class Interpreter:
     # end def cmd_while
 
     def cmd_write (self, fhandle, exprs):
-        file = sys.stdout
+        """ Lines written to files end in CR LF like in GW-BASIC """
+        fobj = None
+        end  = '\n'
         if fhandle is not None:
-            file = self.files [fhandle].f
-        r    = []
-        for ex in exprs ():
-            r.append (repr (ex))
-        print (','.join (r), end = '\r\n', file = file)
+            fobj = self.files [fhandle]
+            if fobj.name != 'SCRN:':
+                end = '\r\n'
+        self.col = 0
+        self._print_out (fobj, ','.join (map (format_write, exprs ())), end)
     # end def cmd_write
 
     # PRODUCTIONS OF PARSER
@@ -2320,23 +3909,53 @@ class Interpreter:
             data-statement : DATA literal-list
         """
         # Must be executed immediately, data can later be read by read commands
-        for d in p [2]:
-            self.data.append (d)
+        key = (self.lineno, self.sublineno)
+        self.line_data.setdefault (key, []).extend (p [2])
         p [0] = ('REM',)
     # end def p_data_statement
 
-    def p_def_statement (self, p):
+    def p_def_head (self, p):
         """
-            def-statement : DEF FNFUNCTION LPAREN varlist RPAREN EQ expr
-                          | DEF VAR VAR LPAREN varlist RPAREN EQ expr
+            def-head : DEF FNFUNCTION LPAREN varlist RPAREN
+                     | DEF VAR VAR LPAREN varlist RPAREN
         """
-        if len (p) == 9:
+        if len (p) == 7:
             if p [2] != 'FN':
                 self.raise_error ('Invalid DEF FN command')
-            p [0] = ['deffn', p [3], p [5], p [8]]
+            fname, varlist = p [3], p [5]
         else:
-            p [0] = ['deffn', p [2][2:], p [4], p [7]]
-    # end def p_defint_statement
+            fname, varlist = p [2][2:], p [4]
+        # The parameters are slots of the function, references in
+        # the function body (parsed after this rule) use these slots
+        # instead of variables.
+        slots = [None] * len (varlist)
+        self.fn_params = dict \
+            ((name, (slots, n)) for n, name in enumerate (varlist))
+        p [0] = (fname, slots)
+    # end def p_def_head
+
+    def p_def_statement (self, p):
+        """
+            def-statement : def-head EQ expr
+        """
+        fname, slots = p [1]
+        body  = p [3]
+        nargs = len (slots)
+        self.fn_params = {}
+        if nargs == 1:
+            def fn (args):
+                if len (args) != 1:
+                    raise ValueError ('FN%s: Wrong number of arguments' % fname)
+                slots [0] = args [0]
+                return body ()
+        else:
+            def fn (args):
+                if len (args) != nargs:
+                    raise ValueError ('FN%s: Wrong number of arguments' % fname)
+                slots [:] = args
+                return body ()
+        p [0] = ['deffn', fname, fn]
+    # end def p_def_statement
 
     def p_defint_statement (self, p):
         """
@@ -2576,6 +4195,8 @@ class Interpreter:
         p1 = p [1]
         def x ():
             return p1
+        # Used for recognizing loops in fuse_read_loops
+        x.literal = True
         p [0] = x
     # end def p_expression_literal
 
@@ -2742,7 +4363,19 @@ class Interpreter:
             expr : VAR
         """
         p1 = p [1]
-        p [0] = self._var_helper (p1)
+        if p1 in self.fn_params:
+            slots, n = self.fn_params [p1]
+            if self.is_single (p1 [-1]):
+                def x ():
+                    return np.single (slots [n])
+            else:
+                def x ():
+                    return slots [n]
+            p [0] = x
+        else:
+            p [0] = self._var_helper (p1)
+            # Used for recognizing loops in fuse_read_loops
+            p [0].var = p1
     # end def p_expression_var
 
     def p_exprlist (self, p):
@@ -2754,10 +4387,12 @@ class Interpreter:
         if len (p) == 2:
             def x ():
                 return [p1 ()]
+            x.exprs = (p1,)
         else:
             p3 = p [3]
             def x ():
                 return p1 () + [p3 ()]
+            x.exprs = p1.exprs + (p3,)
         p [0] = x
     # end def p_exprlist
 
@@ -2888,7 +4523,13 @@ class Interpreter:
         if len (p) == 3:
             p [0] = (p [1], p [2])
         else:
-            p [0] = (p [1], p [4], '', p [2])
+            # Plain variables are all read in one go, plain are the
+            # flags telling which of them are strings
+            names = [lhs.var for lhs in p [4]]
+            plain = None
+            if None not in names:
+                plain = tuple (n.endswith ('$') for n in names)
+            p [0] = (p [1], p [4], '', p [2], plain)
     # end def p_input_statement_multi
 
     def p_intlist (self, p):
@@ -2933,11 +4574,15 @@ class Interpreter:
         if len (p) == 2:
             def x ():
                 return L_Value_Var (self, p1)
+            x.var = p1
         else:
             p3 = p [3]
             def x ():
                 r = [int (k) for k in p3 ()]
                 return L_Value_Dim (self, p1, r)
+            x.var   = None
+            x.array = p1
+            x.index = p3.exprs
         p [0] = x
     # end def p_lhs
 
@@ -3067,10 +4712,11 @@ class Interpreter:
             mid-statement : MID LPAREN lhs COMMA expr COMMA expr RPAREN EQ expr
                           | MID LPAREN lhs COMMA expr RPAREN EQ expr
         """
+        # The command is MID, not the MID$ of the token
         if len (p) == 9:
-            p [0] = (p [1], p [3], p [5], None, p [8])
+            p [0] = ('MID', p [3], p [5], None, p [8])
         else:
-            p [0] = (p [1], p [3], p [5], p [7], p [10])
+            p [0] = ('MID', p [3], p [5], p [7], p [10])
     # end def p_mid_statement
 
     def p_next_statement (self, p):
@@ -3412,7 +5058,7 @@ class Interpreter:
         if len (p) == 5:
             p [0] = [p [1], p [2], p [4]]
         else:
-            p [0] = [p [1], None, p [4]]
+            p [0] = [p [1], None, p [2]]
     # end def p_write
 
 # end class Interpreter
@@ -3423,10 +5069,38 @@ def options (argv):
         ( 'program'
         , help = 'Basic program to run'
         )
+    cmd.add_argument \
+        ( '--checkpoint'
+        , help    = 'Write checkpoints of the running program to the'
+                    ' given file: On SIGUSR1, on SIGTERM (the program'
+                    ' stops after writing the checkpoint) and as'
+                    ' requested with --checkpoint-line and'
+                    ' --checkpoint-statements'
+        )
+    cmd.add_argument \
+        ( '--checkpoint-line'
+        , help    = 'Write a checkpoint when the given line is reached'
+                    ' for the first time'
+        , type    = int
+        )
+    cmd.add_argument \
+        ( '--checkpoint-statements'
+        , help    = 'Write a checkpoint every given number of lines'
+        , type    = int
+        )
     cmd.add_argument \
         ( '--enable-text-color'
         , action  = 'store_true'
         )
+    cmd.add_argument \
+        ( '--filesystem'
+        , help    = 'Filesystem for files of the program, "memory" keeps'
+                    ' files written by the program in memory, files not'
+                    ' written before are read from disk,'
+                    ' default: %(default)s'
+        , choices = ('os', 'memory')
+        , default = 'os'
+        )
     cmd.add_argument \
         ( '-k', '--keystring'
         , help = 'Pre-fill keyboard buffer with given string, may'
@@ -3441,10 +5115,38 @@ def options (argv):
         , help = 'Line in basic where to stop in (python-) debugger'
         , type = int
         )
+    cmd.add_argument \
+        ( '--max-statements'
+        , help    = 'Stop the program after executing the given number'
+                    ' of lines, each loop iteration within a line'
+                    ' counts as a line'
+        , type    = int
+        )
+    cmd.add_argument \
+        ( '--memmap-threshold'
+        , help    = 'Numeric arrays of at least the given size in bytes'
+                    ' are kept in scratch files mapped into memory'
+                    ' instead of RAM'
+        , type    = int
+        )
+    cmd.add_argument \
+        ( '--memmap-dir'
+        , help    = 'Directory for scratch files of --memmap-threshold,'
+                    ' default is the system temporary directory'
+        )
     cmd.add_argument \
         ( '-o', '--output-file'
         , help = 'Write output to given file'
         )
+    cmd.add_argument \
+        ( '--output-buffer-size'
+        , help    = 'Size of buffer in characters for PRINT output to'
+                    ' screen and files, output is written when the buffer'
+                    ' is full, on INPUT, CLOSE and at program end,'
+                    ' 0 disables buffering, default: %(default)s'
+        , type    = int
+        , default = 65536
+        )
     cmd.add_argument \
         ( '--print-version'
         , help    = 'Print version number and exit'
@@ -3458,6 +5160,25 @@ def options (argv):
         , action  = 'append'
         , default = []
         )
+    cmd.add_argument \
+        ( '--resume'
+        , help    = 'Continue the program from a checkpoint written'
+                    ' with --checkpoint'
+        )
+    cmd.add_argument \
+        ( '--refresh-rate'
+        , help    = 'Maximum number of screen updates per second for'
+                    ' graphics screen emulation, 0 updates after each'
+                    ' drawing command, default: %(default)s'
+        , type    = float
+        , default = 50
+        )
+    cmd.add_argument \
+        ( '--timeout'
+        , help    = 'Stop the program after running the given number'
+                    ' of seconds'
+        , type    = float
+        )
     cmd.add_argument \
         ( '-S', '--screen'
         , help    = 'Screen emulation'
@@ -3493,8 +5214,17 @@ def main (argv = sys.argv [1:]):
         return 0
     interpreter = Interpreter (args)
     interpreter.break_lineno = args.break_line
+    if args.checkpoint:
+        for signum in (signal.SIGUSR1, signal.SIGTERM):
+            signal.signal (signum, interpreter.on_checkpoint_signal)
+    if args.resume:
+        interpreter.restore (args.resume)
     interpreter.run ()
+    # An uncaught BASIC error or a limit stopping the program fails
+    if interpreter.run_status () ['status'] != 'ok':
+        return 1
+    return 0
 # end def main
 
 if __name__ == '__main__':
-    main ()
+    sys.exit (main ())
@@ -0,0 +1,225 @@
+#!/usr/bin/python3
+# Copyright (C) 2024-25 Dr. Ralf Schlatterbeck Open Source Consulting.
+# Reichergasse 131, A-3411 Weidling.
+# Web: http://www.runtux.com Email: office@runtux.com
+# All rights reserved
+# ****************************************************************************
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ****************************************************************************
+
+""" Run many BASIC jobs in parallel
+    The jobs are read from a manifest in JSONL format, one job per
+    line, e.g.::
+
+     {"id": "case1", "args": ["mininec.bas", "-i", "case1.in"], "output": "case1.out"}
+
+    The "args" are the command-line arguments of yabasi. The optional
+    "output" is the output file (same as the -o option), "timeout" is
+    the maximum run time in seconds. Each worker process compiles a
+    program only once and re-uses it for all jobs with the same
+    program and options. With the --fork option all programs are
+    compiled in the parent process before the worker processes are
+    forked, the workers share the compiled programs copy-on-write.
+    A summary with status and timings of each job is written in JSONL
+    format.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import multiprocessing
+from copy import copy
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .bas import Interpreter, options, make_filesystem
+
+# Options that only influence input and output of a run, all others
+# select a compiled program
+io_options = set \
+    (( 'input_file', 'keystring', 'output_file', 'break_line', 'filesystem'
+     , 'max_statements', 'timeout'
+    ))
+
+# Compiled programs of this worker process
+compiled = {}
+
+class Job_Timeout (Exception):
+    pass
+# end class Job_Timeout
+
+def on_timeout (signum, frame):
+    raise Job_Timeout ()
+# end def on_timeout
+
+def get_interpreter (args):
+    """ Return compiled interpreter for args and whether it was cached
+    """
+    key = tuple \
+        ( sorted
+            ( (k, repr (v)) for k, v in vars (args).items ()
+              if k not in io_options
+            )
+        )
+    if key in compiled:
+        return compiled [key], True
+    args = copy (args)
+    for k in io_options:
+        setattr (args, k, None)
+    compiled [key] = Interpreter (args)
+    return compiled [key], False
+# end def get_interpreter
+
+def run_job (job, timeout = None):
+    """ Run a single job, returns the summary of the job
+    """
+    result  = dict (id = job.get ('id'), status = 'ok')
+    timeout = job.get ('timeout', timeout)
+    bas     = None
+    ofile   = None
+    t_start = time.time ()
+    try:
+        args  = job_args (job)
+        bas, result ['cached'] = get_interpreter (args)
+        t_run = time.time ()
+        result ['compile_time'] = t_run - t_start
+        # The timeout only limits the run, not the compilation
+        if timeout:
+            signal.signal (signal.SIGALRM, on_timeout)
+            signal.setitimer (signal.ITIMER_REAL, timeout)
+        ofile = open (args.output_file or os.devnull, 'w')
+        kinput = bas.read_kinput (args.input_file, args.keystring)
+        bas.reset (kinput, ofile, make_filesystem (args.filesystem))
+        bas.max_statements = args.max_statements
+        bas.timeout        = args.timeout
+        bas.run ()
+        status = bas.run_status ()
+        result ['status']     = status ['status']
+        result ['line']       = status ['line']
+        result ['statements'] = status ['statements']
+        result ['run_time']   = time.time () - t_run
+    except Job_Timeout:
+        result ['status'] = 'timeout'
+    except Exception as err:
+        result ['status'] = 'exception'
+        result ['error']  = repr (err)
+    finally:
+        if timeout:
+            signal.setitimer (signal.ITIMER_REAL, 0)
+        if ofile is not None:
+            bas.close_output ()
+            ofile.close ()
+    result ['time'] = time.time () - t_start
+    return result
+# end def run_job
+
+def job_args (job):
+    args = list (job ['args'])
+    if job.get ('output'):
+        args.extend (('-o', job ['output']))
+    try:
+        return options (args)
+    except SystemExit:
+        # argparse exits on invalid arguments
+        raise ValueError ('Invalid arguments: %s' % ' '.join (args))
+# end def job_args
+
+def precompile (jobs):
+    """ Compile programs of all jobs, errors are reported when the
+        job is run.
+    """
+    for job in jobs:
+        try:
+            get_interpreter (job_args (job))
+        except Exception:
+            pass
+# end def precompile
+
+def read_manifest (f):
+    for n, line in enumerate (f):
+        line = line.strip ()
+        if not line:
+            continue
+        job = json.loads (line)
+        job.setdefault ('id', n + 1)
+        yield job
+# end def read_manifest
+
+def batch_options (argv):
+    cmd = ArgumentParser ()
+    cmd.add_argument \
+        ( 'manifest'
+        , help    = 'Job manifest in JSONL format, "-" for standard input'
+        )
+    cmd.add_argument \
+        ( '-f', '--fork'
+        , help    = 'Compile programs before starting worker processes,'
+                    ' workers are forked and share the compiled programs'
+        , action  = 'store_true'
+        )
+    cmd.add_argument \
+        ( '-j', '--jobs'
+        , help    = 'Number of worker processes, default: number of CPUs'
+        , type    = int
+        )
+    cmd.add_argument \
+        ( '-o', '--summary'
+        , help    = 'Write summary in JSONL format to given file,'
+                    ' default is standard output'
+        )
+    cmd.add_argument \
+        ( '-t', '--timeout'
+        , help    = 'Default timeout of a job in seconds'
+        , type    = float
+        )
+    args = cmd.parse_args (argv)
+    return args
+# end def batch_options
+
+def main (argv = sys.argv [1:]):
+    args = batch_options (argv)
+    if args.manifest == '-':
+        jobs = list (read_manifest (sys.stdin))
+    else:
+        with open (args.manifest, 'r') as f:
+            jobs = list (read_manifest (f))
+    summary = sys.stdout
+    if args.summary:
+        summary = open (args.summary, 'w')
+    failed = 0
+    ctx    = None
+    if args.fork:
+        precompile (jobs)
+        ctx = multiprocessing.get_context ('fork')
+    with ProcessPoolExecutor \
+        (max_workers = args.jobs, mp_context = ctx) as pool:
+        futures = [pool.submit (run_job, job, args.timeout) for job in jobs]
+        for future in as_completed (futures):
+            result = future.result ()
+            if result ['status'] != 'ok':
+                failed += 1
+            print (json.dumps (result), file = summary, flush = True)
+    if args.summary:
+        summary.close ()
+    return int (bool (failed))
+# end def main
+
+if __name__ == '__main__':
+    sys.exit (main ())